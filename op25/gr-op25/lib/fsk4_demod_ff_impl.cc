@@ -206,6 +206,18 @@ namespace gr {
     {
     }
 
+    void
+    fsk4_demod_ff_impl::reset()
+    {
+      d_history_last = 0;
+      d_symbol_clock = 0.0;
+      d_symbol_spread = 2.0;
+      fine_frequency_correction = 0.0;
+      coarse_frequency_correction = 0.0;
+
+      std::fill(&d_history[0], &d_history[NTAPS], 0.0);
+    }
+
     void
     fsk4_demod_ff_impl::forecast (int noutput_items, gr_vector_int &ninput_items_required)
     {
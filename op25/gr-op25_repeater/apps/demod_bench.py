@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Max H. Parke KA1RBI
+#
+# This file is part of OP25
+#
+# OP25 is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# OP25 is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OP25; see the file COPYING. If not, write to the Free
+# Software Foundation, Inc., 51 Franklin Street, Boston, MA
+# 02110-1301, USA.
+
+#
+# p25_demod_cb front end benchmark
+#
+# Runs a block of noise through p25_demod_cb as fast as the flowgraph
+# will go, once per input rate and front end, and reports input
+# samples/sec and the multiple of real time.  The front ends are
+# "mixer" (lo, multiply_cc and a decimating fir_filter) and "xlate"
+# (a single freq_xlating_fir_filter).  Each is run with the single
+# stage channel filter and with the multi-stage decimation_plan.  The
+# demodulator is tuned off center with -f so the lo is not idle.
+#
+# With -d the channel filter plans are printed instead: the stages, the
+# filter multiply-accumulates per input sample, and the alias rejection,
+# the least attenuation of the cascade over the input frequencies that
+# fold onto the 7250 Hz passband at the output rate.
+#
+
+import time
+import numpy
+from gnuradio import gr, blocks
+from gnuradio.eng_option import eng_option
+from optparse import OptionParser
+
+import p25_demodulator
+
+NOISE_LEN = 1 << 16	# repeated noise buffer, samples
+PASSBAND = 7250
+FRONT_ENDS = [('mixer', False, False),	# name xlate multistage
+              ('xlate', True, False),
+              ('multi', False, True),
+              ('xlate-multi', True, True)]
+
+class bench_block(gr.top_block):
+    def __init__(self, input_rate, nsamples, relative_freq, **kwargs):
+        gr.top_block.__init__(self)
+        noise = numpy.random.randn(NOISE_LEN) + 1j * numpy.random.randn(NOISE_LEN)
+        src = blocks.vector_source_c(list(noise * 0.1), True)
+        head = blocks.head(gr.sizeof_gr_complex, nsamples)
+        self.demod = p25_demodulator.p25_demod_cb(input_rate=input_rate,
+                                                  relative_freq=relative_freq,
+                                                  **kwargs)
+        sink = blocks.null_sink(gr.sizeof_char)
+        self.connect(src, head, self.demod, sink)
+
+def run(input_rate, seconds, relative_freq, **kwargs):
+    nsamples = int(input_rate * seconds)
+    tb = bench_block(input_rate, nsamples, relative_freq, **kwargs)
+    t0 = time.time()
+    tb.run()
+    elapsed = time.time() - t0
+    return nsamples / elapsed, seconds / elapsed
+
+def response(taps, rate, freqs):	# magnitude at freqs, filter run at rate
+    n = numpy.arange(len(taps))
+    h = numpy.zeros(len(freqs))
+    for i in xrange(0, len(freqs), 256):
+        w = numpy.exp(-2j * numpy.pi * numpy.outer(freqs[i:i+256], n) / rate)
+        h[i:i+256] = numpy.abs(numpy.dot(w, numpy.array(taps)))
+    return h
+
+def alias_rejection(stages, input_rate, output_rate):
+    freqs = []
+    k = 1
+    while k * output_rate - PASSBAND <= input_rate / 2:
+        freqs.append(k * output_rate + numpy.linspace(-PASSBAND, PASSBAND, 64))
+        k += 1
+    if not freqs:
+        return None
+    freqs = numpy.concatenate(freqs)
+    rate = float(input_rate)
+    h = numpy.ones(len(freqs))
+    for decimation, taps in stages:
+        h *= response(taps, rate, freqs) / abs(sum(taps))
+        rate /= decimation
+    return -20 * numpy.log10(max(h.max(), 1e-12))
+
+def design(rate, if_rate):
+    for multistage in [False, True]:
+        stages, output_rate = p25_demodulator.decimation_plan(rate, if_rate, multistage)
+        macs = 0.0
+        r = float(rate)
+        desc = []
+        for decimation, taps in stages:
+            macs += len(taps) / float(decimation) * r / rate	# per input sample
+            desc.append('%d/%d' % (len(taps), decimation))
+            r /= decimation
+        rejection = alias_rejection(stages, rate, output_rate)
+        print '%10.0f %-6s %-32s %8.1f %8.0f %7.1f dB' % (rate, ['single', 'multi'][multistage], ' '.join(desc), macs, output_rate, rejection or 0)
+
+def main():
+    parser = OptionParser(option_class=eng_option)
+    parser.add_option("-r", "--rates", type="string", default="1e6,2.4e6,3.2e6", help="input sample rates, comma separated")
+    parser.add_option("-s", "--seconds", type="eng_float", default=10.0, help="seconds of input per run")
+    parser.add_option("-f", "--relative-freq", type="eng_float", default=100e3, help="demodulator tuning offset", metavar="Hz")
+    parser.add_option("-i", "--if-rate", type="eng_float", default=48000, help="demodulator if rate")
+    parser.add_option("-d", "--design", action="store_true", default=False, help="print the channel filter plans, do not run")
+    (options, args) = parser.parse_args()
+    rates = [float(r) for r in options.rates.split(',')]
+
+    if options.design:
+        print '%10s %-6s %-32s %8s %8s %10s' % ('rate', 'plan', 'taps/decimation', 'macs', 'out rate', 'rejection')
+        for rate in rates:
+            design(rate, options.if_rate)
+        return
+
+    print '%10s %-12s %12s %10s' % ('rate', 'front', 'samples/sec', 'realtime')
+    for rate in rates:
+        base = None
+        for name, xlate, multistage in FRONT_ENDS:
+            sps, realtime = run(rate, options.seconds, options.relative_freq, if_rate=options.if_rate, xlate=xlate, multistage=multistage)
+            if base is None:
+                base = sps
+            print '%10.0f %-12s %12.0f %9.1fx %6.2fx' % (rate, name, sps, realtime, sps / base)
+
+if __name__ == '__main__':
+    main()
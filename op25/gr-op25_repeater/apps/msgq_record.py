@@ -0,0 +1,106 @@
+
+# Copyright 2016 Max H. Parke KA1RBI
+#
+# This file is part of OP25
+#
+# OP25 is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# OP25 is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OP25; see the file COPYING. If not, write to the Free
+# Software Foundation, Inc., 51 Franklin Street, Boston, MA
+# 02110-1301, USA.
+
+#
+# recording of the decoder message queue (rx_q) traffic
+#
+# The file starts with MAGIC, followed by one record per message:
+# a RECORD header (timestamp, message type, nac, payload length)
+# then the payload.  For data units the payload is the message body
+# after the two nac bytes; for timeouts and gui commands (type < 0)
+# nac is zero and the payload is the whole message body.
+#
+# Messages drained from the queue together are written with the same
+# timestamp, so a replay can hand them to rx_ctl as the same batch.
+#
+
+import struct
+
+MAGIC = 'OP25MSGQ\x01'
+RECORD = struct.Struct('<dhHH')	# time type nac len
+
+class recorded_msg(object):
+    # stands in for gr.message when replaying
+    def __init__(self, type, s, arg1=0, arg2=0):
+        self._type = type
+        self._s = s
+        self._arg1 = arg1
+        self._arg2 = arg2
+
+    def type(self):
+        return self._type
+
+    def to_string(self):
+        return self._s
+
+    def arg1(self):
+        return self._arg1
+
+    def arg2(self):
+        return self._arg2
+
+class msgq_recorder(object):
+    def __init__(self, filename):
+        self.fp = open(filename, 'wb')
+        self.fp.write(MAGIC)
+
+    def write(self, msgs, t):
+        buf = []
+        for msg in msgs:
+            type = msg.type()
+            s = msg.to_string()
+            nac = 0
+            if type >= 0:
+                nac = struct.unpack_from('>H', s)[0]
+                s = s[2:]
+            buf.append(RECORD.pack(t, type, nac, len(s)))
+            buf.append(s)
+        self.fp.write(''.join(buf))
+
+    def close(self):
+        self.fp.close()
+
+def read_recording(filename):
+    # yield (timestamp, recorded_msg) in recorded order
+    fp = open(filename, 'rb')
+    assert fp.read(len(MAGIC)) == MAGIC	# not a msgq recording
+    while True:
+        hdr = fp.read(RECORD.size)
+        if len(hdr) < RECORD.size:
+            break
+        t, type, nac, length = RECORD.unpack(hdr)
+        s = fp.read(length)
+        if type >= 0:
+            s = struct.pack('>H', nac) + s
+        yield t, recorded_msg(type, s)
+    fp.close()
+
+def read_batches(filename):
+    # yield (timestamp, [recorded_msg, ...]) grouping messages drained together
+    batch = []
+    batch_time = None
+    for t, msg in read_recording(filename):
+        if batch and t != batch_time:
+            yield batch_time, batch
+            batch = []
+        batch_time = t
+        batch.append(msg)
+    if batch:
+        yield batch_time, batch
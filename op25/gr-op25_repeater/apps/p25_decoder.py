@@ -128,5 +128,8 @@ class p25_decoder_sink_b(gr.hier_block2):
         self.xorhash[index] = xorhash
         self.p25_decoders[index].set_xormask(xormask)
 
+    def get_msgq_drops(self):	# messages lost to a full queue, all slots
+        return sum([d.get_msgq_drops() for d in self.p25_decoders])
+
     def set_scaler_k(self, k, index=0):
         self.scaler[index].set_k(k)
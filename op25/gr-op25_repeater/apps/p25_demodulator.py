@@ -45,6 +45,34 @@ _def_costas_alpha = 0.04
 _def_symbol_rate = 4800
 _def_symbol_deviation = 600.0
 _def_bb_gain = 1.0
+_def_channel_spacing = 25000
+_def_stage_atten = 120	# dB, decimate by 2 stages
+_def_min_stage_ratio = 4	# stop halving below this multiple of if_rate
+
+def decimation_plan(input_rate, if_rate, multistage=True):
+    """
+    Plan the channel filter from input_rate down to about if_rate.
+
+    The final stage is the 7250/725 Hz low pass, decimating to the last
+    rate at or above if_rate.  With multistage it is preceded by
+    decimate by 2 stages for as long as the rate stays above
+    _def_min_stage_ratio * if_rate.  Their transition bands only need
+    to keep aliases off the final passband, so each has a handful of
+    taps, and the long final filter runs at a fraction of input_rate.
+
+    Returns a list of (decimation, taps) and the output rate.
+    """
+    stages = []
+    rate = float(input_rate)
+    passband = 7250 + 725	# final stage stop edge
+    while multistage and rate / 2 >= _def_min_stage_ratio * if_rate:
+        stopband = rate / 2 - passband	# aliases land above passband
+        taps = filter.optfir.low_pass(1.0, rate, passband, stopband, 0.1, _def_stage_atten)
+        stages.append((2, taps))
+        rate /= 2
+    decimation = int(rate / if_rate)
+    stages.append((decimation, filter.firdes.low_pass(1.0, rate, 7250, 725, filter.firdes.WIN_HANN)))
+    return stages, rate / decimation
 
 # /////////////////////////////////////////////////////////////////////////////
 #                           demodulator
@@ -130,6 +158,69 @@ class p25_demod_fb(p25_demod_base):
         self.connect(self.fsk4_demod, sink)
         self.float_sink = [self.fsk4_demod, sink]
 
+def channelizer_channels(input_rate, spacing=_def_channel_spacing):
+    # number of p25_channelizer channels (and so the most outputs) at input_rate
+    return max(2, 2 * int(input_rate / (2 * spacing)))	# even, for 2x oversampling
+
+class p25_channelizer(gr.hier_block2):
+
+    def __init__(self,
+                 input_rate	= None,
+                 outputs	= 1,
+                 spacing	= _def_channel_spacing):
+        """
+	Shared front end for the logfile worker demodulators.
+
+	The complex input is split into numchans channels, about spacing
+	Hz apart, in a single polyphase filterbank/FFT pass, so the cost
+	per input sample does not depend on the number of workers.  Each
+	output carries the channel selected with set_channel, oversampled
+	2x to channel_rate so a P25 signal anywhere in the channel passes
+	without aliasing; the worker demodulator tunes out the remaining
+	offset at channel_rate.
+        @param input_rate: sample rate of complex input channel
+        @type input_rate: int
+        @param outputs: number of outputs (workers)
+        @type outputs: int
+	"""
+
+	gr.hier_block2.__init__(self, "p25_channelizer",
+				gr.io_signature(1, 1, gr.sizeof_gr_complex),       # Input signature
+				gr.io_signature(outputs, outputs, gr.sizeof_gr_complex)) # Output signature
+
+        self.input_rate = input_rate
+        self.numchans = channelizer_channels(input_rate, spacing)
+        assert outputs <= self.numchans
+        self.spacing = float(input_rate) / self.numchans
+        self.channel_rate = 2 * self.spacing
+
+        # pass a 12.5 KHz signal offset up to spacing/2, stop before
+        # anything aliases onto it at the 2x output rate
+        passband = self.spacing / 2 + 7250
+        stopband = 1.5 * self.spacing - 7250
+        taps = filter.firdes.low_pass_2(1.0, input_rate, (passband + stopband) / 2, stopband - passband, 80, filter.firdes.WIN_BLACKMAN_hARRIS)
+
+        self.channel_map = [0] * outputs
+        self.s2ss = blocks.stream_to_streams(gr.sizeof_gr_complex, self.numchans)
+        self.pfb = filter.pfb_channelizer_ccf(self.numchans, taps, 2.0)
+        self.pfb.set_channel_map(self.channel_map)
+        self.connect(self, self.s2ss)
+        for i in xrange(self.numchans):
+            self.connect((self.s2ss, i), (self.pfb, i))
+        for i in xrange(outputs):
+            self.connect((self.pfb, i), (self, i))
+
+    def set_channel(self, output, freq):
+        """
+	Select the channel for output nearest relative frequency freq (the
+	p25_demod_cb lo frequency, i.e. minus the signal offset) and return
+	the lo frequency that remains to be tuned at channel_rate.
+	"""
+        k = int(round(-freq / self.spacing))
+        self.channel_map[output] = k % self.numchans
+        self.pfb.set_channel_map(self.channel_map)
+        return freq + k * self.spacing
+
 class p25_demod_cb(p25_demod_base):
 
     def __init__(self,
@@ -140,13 +231,31 @@ class p25_demod_cb(p25_demod_base):
                  if_rate	= _def_if_rate,
                  gain_mu	= _def_gain_mu,
                  costas_alpha	= _def_costas_alpha,
-                 symbol_rate	= _def_symbol_rate):
+                 symbol_rate	= _def_symbol_rate,
+                 channelizer	= None,
+                 channel	= 0,
+                 xlate		= False,
+                 multistage	= True,
+                 parkable	= False):
         """
 	Hierarchical block for P25 demodulation.
 
 	The complex input is tuned, decimated and demodulated
         @param input_rate: sample rate of complex input channel
         @type input_rate: int
+        @param channelizer: shared p25_channelizer; the input is then its
+	output number channel, at channelizer.channel_rate, and input_rate
+	is still the rate of the full band the block tunes across
+        @type channelizer: p25_channelizer
+        @param xlate: tune, filter and decimate in one freq_xlating_fir_filter
+	pass instead of a separate lo, mixer and fir_filter
+        @type xlate: bool
+        @param multistage: channel filter per decimation_plan, otherwise
+	a single stage at the input rate
+        @type multistage: bool
+        @param parkable: put a valve ahead of the chain so that set_idle
+	can park the block (logfile workers); costs a copy of the input
+        @type parkable: bool
 	"""
 
 	gr.hier_block2.__init__(self, "p25_demod_cb",
@@ -164,22 +273,47 @@ class p25_demod_cb(p25_demod_base):
         self.lo_freq = 0
         self.float_sink = None
         self.complex_sink = None
+        self.channelizer = channelizer
+        self.channel = channel
+        self.xlate = None
+        self.idle = False
+        self.valve = None
+
+        head = self
+        if parkable:
+            # input valve, see set_idle
+            self.valve = blocks.copy(gr.sizeof_gr_complex)
+            self.connect(self, self.valve)
+            head = self.valve
 
-        # local osc
-        self.lo = analog.sig_source_c (input_rate, analog.GR_SIN_WAVE, 0, 1.0, 0)
-        self.mixer = blocks.multiply_cc()
-        lpf_coeffs = filter.firdes.low_pass(1.0, input_rate, 7250, 725, filter.firdes.WIN_HANN)
-        decimation = int(input_rate / if_rate)
-        self.lpf = filter.fir_filter_ccf(decimation, lpf_coeffs)
+        chan_rate = input_rate
+        if channelizer is not None:
+            chan_rate = channelizer.channel_rate
 
-        resampled_rate = float(input_rate) / float(decimation) # rate at output of self.lpf
+        stages, resampled_rate = decimation_plan(chan_rate, if_rate, multistage)	# rate at output of self.lpf
 
         self.arb_resampler = filter.pfb.arb_resampler_ccf(
            float(self.if_rate) / resampled_rate)
 
-        self.connect(self, (self.mixer, 0))
-        self.connect(self.lo, (self.mixer, 1))
-        self.connect(self.mixer, self.lpf, self.arb_resampler)
+        if xlate:
+            # the taps are rotated to the lo frequency, only output samples are computed
+            decimation, taps = stages.pop(0)
+            self.xlate = filter.freq_xlating_fir_filter_ccf(decimation, taps, 0, chan_rate)
+            self.connect(head, self.xlate)
+            chain = [self.xlate]
+        else:
+            # local osc
+            self.lo = analog.sig_source_c (chan_rate, analog.GR_SIN_WAVE, 0, 1.0, 0)
+            self.mixer = blocks.multiply_cc()
+            self.connect(head, (self.mixer, 0))
+            self.connect(self.lo, (self.mixer, 1))
+            chain = [self.mixer]
+        self.decim = [filter.fir_filter_ccf(decimation, taps) for decimation, taps in stages]
+        if self.decim:
+            self.lpf = self.decim[-1]
+        else:
+            self.lpf = self.xlate
+        self.connect(*(chain + self.decim + [self.arb_resampler]))
 
         levels = [ -2.0, 0.0, 2.0, 4.0 ]
         self.slicer = op25_repeater.fsk4_slicer_fb(levels)
@@ -222,6 +356,20 @@ class p25_demod_cb(p25_demod_base):
         print 'set_omega %d %f' % (omega, sps)
         self.clock.set_omega(self.sps)
 
+    def set_idle(self, idle):
+        # an idle block discards its input at the valve, so nothing
+        # downstream runs.  It wakes with the symbol timing loops of both
+        # chains reset; the filters and fm demod hold only a few ms of
+        # input samples, flushed by the new signal, and the agc adapts
+        # within 16 samples.  No-op unless built parkable
+        if self.valve is None or idle == self.idle:
+            return
+        self.idle = idle
+        if not idle:
+            self.clock.reset()
+            self.fsk4_demod.reset()
+        self.valve.set_enabled(not idle)
+
     def set_relative_frequency(self, freq):
         if abs(freq) > self.input_rate/2:
             #print 'set_relative_frequency: error, relative frequency %d exceeds limit %d' % (freq, self.input_rate/2)
@@ -230,7 +378,12 @@ class p25_demod_cb(p25_demod_base):
             return True
         #print 'set_relative_frequency', freq
         self.lo_freq = freq
-        self.lo.set_frequency(self.lo_freq)
+        if self.channelizer is not None:
+            freq = self.channelizer.set_channel(self.channel, freq)
+        if self.xlate is not None:
+            self.xlate.set_center_freq(-freq)	# lo shifts up by freq, the filter shifts down
+        else:
+            self.lo.set_frequency(freq)
         return True
 
     # assumes lock held or init
@@ -294,6 +447,9 @@ class p25_demod_cb(p25_demod_base):
             self.connect(self.diffdec, sink)
             self.complex_sink = [self.diffdec, sink]
         elif src == 'mixer':
+            if self.xlate is not None:
+                print 'connect_complex: no full rate mixer output with xlate front end'
+                return
             self.connect(self.mixer, sink)
             self.complex_sink = [self.mixer, sink]
         elif src == 'chan':
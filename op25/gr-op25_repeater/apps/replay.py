@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Max H. Parke KA1RBI
+#
+# This file is part of OP25
+#
+# OP25 is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# OP25 is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OP25; see the file COPYING. If not, write to the Free
+# Software Foundation, Inc., 51 Franklin Street, Boston, MA
+# 02110-1301, USA.
+
+#
+# headless replay of a decoder message queue recording
+#
+# Feeds a recording made with scope.py --msgq-record through
+# trunking.rx_ctl as fast as possible, in the batches it was drained
+# in, with the clock driven by the recorded timestamps.  No wx or GNU
+# Radio is needed; tuning requests go to a stub frequency_set callback
+# and -L sets up stub logfile workers, which --max-workers lets grow
+# as worker_pool would.
+#
+# Reports messages/sec and tune decision counts.  With -p each message
+# is replayed and timed on its own and the time is broken down by
+# message type and opcode; as the batches are split up, the tune
+# decisions can differ from a batched replay.  With -o every tune
+# decision is written to a file, which can be diffed between revisions
+# of trunking.py.
+#
+
+import os
+import sys
+import time
+from optparse import OptionParser
+
+import trunking
+import msgq_record
+
+class stub_demod(object):
+    def __init__(self, input_rate, counts):
+        self.input_rate = input_rate
+        self.counts = counts
+
+    def set_relative_frequency(self, freq):
+        if freq:
+            self.counts['worker tunes'] += 1
+
+    def set_omega(self, rate):
+        pass
+
+    def set_idle(self, idle):
+        pass
+
+    def connect_chain(self, chain):
+        pass
+
+class stub_decoder(object):
+    def __init__(self, counts):
+        self.counts = counts
+
+    def set_output(self, filename, index=0):
+        if filename.startswith('tgid-'):
+            self.counts['recordings'] += 1
+
+    def set_xormask(self, xormask, xorhash, index=0):
+        pass
+
+def msg_key(msg):
+    type = msg.type()
+    if type == -2:
+        return 'command'
+    if type == -1:
+        return 'timeout'
+    s = msg.to_string()
+    if s[:2] == '\xff\xff':
+        return 'tdma duid%d' % type
+    if type == 7:
+        return 'tsbk %02x' % (ord(s[2]) & 0x3f)
+    if type == 12:
+        return 'mbt %02x' % (ord(s[9]) & 0x3f)	# header bits 32-37
+    return 'duid%d' % type
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-i", "--input", type="string", default=None, help="msgq recording file")
+    parser.add_option("-T", "--trunk-conf-file", type="string", default=None, help="trunking config file name")
+    parser.add_option("-L", "--logfile-workers", type="int", default=None, help="number of stub demodulators")
+    parser.add_option("--max-workers", type="int", default=None, help="grow the stub demodulators on demand up to this number")
+    parser.add_option("-S", "--sample-rate", type="int", default=320e3, help="source samp rate seen by the workers")
+    parser.add_option("-p", "--profile", action="store_true", default=False, help="time each message, by opcode")
+    parser.add_option("-o", "--tune-log", type="string", default=None, help="write tune decisions to file")
+    parser.add_option("-v", "--verbosity", type="int", default=0, help="message debug level; rx_ctl output is shown if nonzero")
+    (options, args) = parser.parse_args()
+    if not options.input:
+        parser.error('recording file (-i) is required')
+
+    batches = msgq_record.read_batches(options.input)
+    try:
+        start_time, batch = batches.next()
+    except StopIteration:
+        print 'empty recording'
+        return
+
+    clock = trunking.sim_clock(start_time)
+    counts = {'tunes': 0, 'worker tunes': 0, 'recordings': 0, 'pool grows': 0}
+    frequencies = set()
+    tgids = set()
+    tune_log = None
+    if options.tune_log:
+        tune_log = open(options.tune_log, 'w')
+    def frequency_set(params):
+        counts['tunes'] += 1
+        frequencies.add(params['freq'])
+        tgids.add(params['tgid'])
+        if tune_log:
+            tune_log.write('%f %d %s %x %s\n' % (clock(), params['freq'], params['tgid'], params['nac'], params['tdma']))
+
+    workers = None
+    add_workers = None
+    if options.logfile_workers or options.max_workers:
+        workers = [{'demod': stub_demod(options.sample_rate, counts), 'decoder': stub_decoder(counts), 'active': False} for i in xrange(options.logfile_workers or 1)]
+    if options.max_workers:
+        def add_workers(n, demod_type):
+            n = min(n, options.max_workers - len(workers))
+            if n <= 0:
+                return 0
+            workers.extend([{'demod': stub_demod(options.sample_rate, counts), 'decoder': stub_decoder(counts), 'active': False} for i in xrange(n)])
+            counts['pool grows'] += 1
+            return n
+
+    stdout = sys.stdout
+    if not options.verbosity:
+        sys.stdout = open(os.devnull, 'w')
+    rx = trunking.rx_ctl(frequency_set=frequency_set, debug=options.verbosity, conf_file=options.trunk_conf_file, logfile_workers=workers, clock=clock, add_workers=add_workers)
+
+    nmsgs = 0
+    nbatches = 0
+    end_time = start_time
+    elapsed = 0.0
+    profile = {}
+    while batch is not None:
+        clock.set(end_time)
+        nbatches += 1
+        nmsgs += len(batch)
+        if options.profile:
+            for msg in batch:
+                key = msg_key(msg)
+                t0 = time.time()
+                rx.process_qmsgs([msg])
+                t1 = time.time()
+                if key not in profile:
+                    profile[key] = [0, 0.0]
+                profile[key][0] += 1
+                profile[key][1] += t1 - t0
+                elapsed += t1 - t0
+        else:
+            t0 = time.time()
+            rx.process_qmsgs(batch)
+            elapsed += time.time() - t0
+        try:
+            end_time, batch = batches.next()
+        except StopIteration:
+            batch = None
+    sys.stdout = stdout
+    if tune_log:
+        tune_log.close()
+
+    span = end_time - start_time
+    print 'replay: %d messages in %d batches, %.1f seconds of traffic' % (nmsgs, nbatches, span)
+    print 'replay: %.3f seconds, %.0f msgs/sec, %.0fx real time' % (elapsed, nmsgs / max(elapsed, 1e-9), span / max(elapsed, 1e-9))
+    print 'tunes: frequency_set %d (%d frequencies, %d talkgroups) worker tunes %d recordings %d' % (counts['tunes'], len(frequencies), len(tgids - set([None])), counts['worker tunes'], counts['recordings'])
+    if workers:
+        print 'workers: %d, pool grown %d times' % (len(workers), counts['pool grows'])
+    for nac in sorted(rx.trunked_systems):
+        tsys = rx.trunked_systems[nac]
+        print 'nac 0x%x: %s' % (nac, ' '.join(['%s %d' % (k, tsys.stats[k]) for k in sorted(tsys.stats)]))
+    latency = rx.latency.snapshot()
+    if latency:
+        print 'grant to tune latency (queue time is not recorded):'
+        print '\n'.join(trunking.profile_lines(latency))
+    if profile:
+        print '%-12s %10s %12s %10s' % ('message', 'count', 'total ms', 'mean us')
+        for key in sorted(profile):
+            n, t = profile[key]
+            print '%-12s %10d %12.1f %10.1f' % (key, n, t * 1e3, t * 1e6 / n)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Max H. Parke KA1RBI
+#
+# This file is part of OP25
+#
+# OP25 is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# OP25 is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OP25; see the file COPYING. If not, write to the Free
+# Software Foundation, Inc., 51 Franklin Street, Boston, MA
+# 02110-1301, USA.
+
+#
+# headless trunking receiver
+#
+# The receive chain of scope.py (p25_demod_cb, p25_decoder_sink_b and
+# trunking.rx_ctl, plus the logfile workers) without wx or any of the
+# plot sinks, for unattended machines with no display.  Takes the same
+# source, trunking and logfile worker options as scope.py.  With
+# --status-interval the rx_ctl status and profiles are printed
+# periodically; otherwise runs until interrupted.
+#
+
+import os
+import sys
+import time
+from gnuradio import gr, blocks
+from gnuradio.eng_option import eng_option
+from optparse import OptionParser
+
+import trunking
+import msgq_record
+import worker_pool
+
+import p25_demodulator
+import p25_decoder
+
+sys.path.append('tdma')
+import lfsr
+
+os.environ['IMBE'] = 'soft'
+
+WIRESHARK_PORT = 23456
+
+class p25_rx_block (gr.top_block):
+
+    def __init__(self, options):
+        gr.top_block.__init__(self)
+        self.options = options
+        self.channel_rate = options.sample_rate
+        self.basic_rate = 48000
+        self.symbol_rate = 4800
+        self.tdma_state = False
+        self.xor_cache = {}
+        self.src = None
+
+        if options.hamlib_model:
+            self.hamlib_attach(options.hamlib_model)
+
+        if options.ifile:
+            self.channel_rate = 96000	# TODO: fixme
+            ifile = blocks.file_source(gr.sizeof_gr_complex, options.ifile, 1)
+            if options.seek > 0:
+                rc = ifile.seek(options.seek*1024, gr.SEEK_SET)
+                assert rc == True
+            throttle = blocks.throttle(gr.sizeof_gr_complex, self.channel_rate)
+            source = blocks.multiply_const_cc(options.gain or 1.0)
+            self.connect(ifile, throttle, source)
+            capture_rate = self.channel_rate
+        else:
+            import osmosdr
+            self.src = osmosdr.source(options.args)
+            if options.gains:
+                for tuple in options.gains.split(","):
+                    name, gain = tuple.split(":")
+                    gain = int(gain)
+                    print "setting gain %s to %d" % (name, gain)
+                    self.src.set_gain(gain, name)
+            if options.freq_corr:
+                self.src.set_freq_corr(options.freq_corr)
+            capture_rate = self.src.set_sample_rate(options.sample_rate)
+            if options.antenna:
+                self.src.set_antenna(options.antenna)
+            self.src.set_bandwidth(capture_rate)
+            r = self.src.set_center_freq(options.frequency + options.calibration + options.offset)
+            print 'set_center_freq: %d' % r
+            if not r:
+                raise RuntimeError("failed to set osmosdr frequency")
+            source = self.src
+        self.build_graph(source, capture_rate)
+
+    def build_graph(self, source, capture_rate):
+        self.rx_q = gr.msg_queue(100)
+        udp_port = 0
+        if self.options.wireshark:
+            udp_port = WIRESHARK_PORT
+
+        self.lo_freq = self.options.offset
+        if self.options.ifile:
+            self.lo_freq += self.options.calibration
+        self.demod = p25_demodulator.p25_demod_cb( input_rate = capture_rate,
+                                                   demod_type = 'cqpsk',		### FIXME
+                                                   relative_freq = self.lo_freq,
+                                                   offset = self.options.offset,
+                                                   if_rate = 48000,
+                                                   gain_mu = self.options.gain_mu,
+                                                   costas_alpha = self.options.costas_alpha,
+                                                   symbol_rate = self.symbol_rate,
+                                                   xlate = self.options.xlate)
+
+        num_ambe = 0
+        if self.options.phase2_tdma:
+            num_ambe = 1
+
+        self.decoder = p25_decoder.p25_decoder_sink_b(dest=self.options.audio_dest, do_imbe=True, num_ambe=num_ambe, wireshark_host=self.options.wireshark_host, udp_port=udp_port, do_msgq = True, msgq=self.rx_q, audio_output=self.options.audio_output, debug=self.options.verbosity)
+
+        self.connect(source, self.demod, self.decoder)
+
+        logfile_workers = []
+        add_workers = None
+        self.worker_pool = None
+        if self.options.logfile_workers or self.options.max_workers:
+            if not self.options.logfile_workers:
+                self.options.logfile_workers = 1
+            self.worker_pool = worker_pool.worker_pool(self, source, capture_rate, self.options)
+            logfile_workers = self.worker_pool.workers
+            add_workers = self.worker_pool.add_workers
+
+        self.trunk_rx = trunking.rx_ctl(frequency_set = self.change_freq, debug = self.options.verbosity, conf_file = self.options.trunk_conf_file, logfile_workers=logfile_workers, latency_log=self.options.latency_log, state_dir=self.options.cache_dir, add_workers=add_workers)
+        if self.worker_pool is not None:	# initial workers, of the type the system needs
+            self.worker_pool.build_workers(self.options.logfile_workers, self.trunk_rx.worker_demod_type())
+
+        self.recorder = None	# closed at shutdown, after the flowgraph stops
+        if self.options.msgq_record:
+            self.recorder = msgq_record.msgq_recorder(self.options.msgq_record)
+        self.du_watcher = trunking.du_queue_watcher(self.rx_q, self.trunk_rx.process_qmsgs, recorder=self.recorder)
+
+    def configure_tdma(self, params):
+        if params['tdma'] is not None and not self.options.phase2_tdma:
+            print '***TDMA request for frequency %d failed- phase2_tdma option not enabled' % params['freq']
+            return
+        set_tdma = False
+        if params['tdma'] is not None:
+            set_tdma = True
+        if set_tdma == self.tdma_state:
+            return	# already in desired state
+        self.tdma_state = set_tdma
+        if set_tdma:
+            self.decoder.set_slotid(params['tdma'])
+            hash = '%x%x%x' % (params['nac'], params['sysid'], params['wacn'])
+            if hash not in self.xor_cache:
+                self.xor_cache[hash] = lfsr.p25p2_lfsr(params['nac'], params['sysid'], params['wacn']).xor_chars
+            self.decoder.set_xormask(self.xor_cache[hash], hash)
+            sps = self.basic_rate / 6000
+        else:
+            sps = self.basic_rate / 4800
+        self.demod.clock.set_omega(float(sps))
+
+    def change_freq(self, params):
+        freq = params['freq']
+        offset = params['offset']
+        center_freq = params['center_frequency']
+
+        if self.options.hamlib_model:
+            self.hamlib.set_freq(freq)
+        elif params['center_frequency']:
+            relative_freq = center_freq - freq
+            if abs(relative_freq + self.options.offset) > self.channel_rate / 2:
+                print '***unable to tune Local Oscillator to offset %d Hz' % (relative_freq + self.options.offset)
+                print '***limit is one half of sample-rate %d = %d' % (self.channel_rate, self.channel_rate / 2)
+                print '***request for frequency %d rejected' % freq
+
+            self.lo_freq = self.options.offset + relative_freq
+            self.demod.set_relative_frequency(self.lo_freq)
+            self.set_freq(center_freq + offset)
+        else:
+            self.set_freq(freq + offset)
+
+        self.configure_tdma(params)
+
+    def set_freq(self, target_freq):
+        if not self.src:
+            return False
+        tune_freq = target_freq + self.options.calibration + self.options.offset
+        return bool(self.src.set_center_freq(tune_freq))
+
+    def hamlib_attach(self, model):
+        import Hamlib
+        Hamlib.rig_set_debug (Hamlib.RIG_DEBUG_NONE)	# RIG_DEBUG_TRACE
+
+        self.hamlib = Hamlib.Rig (model)
+        self.hamlib.set_conf ("serial_speed","9600")
+        self.hamlib.set_conf ("retry","5")
+
+        self.hamlib.open ()
+
+    def status_string(self):
+        s = self.trunk_rx.to_string()
+        s += '\nmessage queue drops %d\n' % self.decoder.get_msgq_drops()
+        return s
+
+def main():
+    parser = OptionParser(option_class=eng_option)
+    parser.add_option("--args", type="string", default="", help="device args")
+    parser.add_option("--antenna", type="string", default="", help="select antenna")
+    parser.add_option("-c", "--calibration", type="eng_float", default=0.0, help="USRP offset", metavar="Hz")
+    parser.add_option("-C", "--costas-alpha", type="eng_float", default=0.04, help="value of alpha for Costas loop", metavar="Hz")
+    parser.add_option("-d", "--audio-dest", type="choice", choices=['audio', 'wav'], default='audio', help="control channel decoder audio: audio or wav")
+    parser.add_option("-f", "--frequency", type="eng_float", default=0.0, help="USRP center frequency", metavar="Hz")
+    parser.add_option("-F", "--ifile", type="string", default=None, help="read input from complex capture file")
+    parser.add_option("-g", "--gain", type="eng_float", default=None, help="ifile gain")
+    parser.add_option("-G", "--gain-mu", type="eng_float", default=0.025, help="gardner gain")
+    parser.add_option("-H", "--hamlib-model", type="int", default=None, help="specify model for hamlib")
+    parser.add_option("-s", "--seek", type="int", default=0, help="ifile seek in K")
+    parser.add_option("-L", "--logfile-workers", type="int", default=None, help="number of demodulators to instantiate")
+    parser.add_option("--max-workers", type="int", default=None, help="grow the logfile workers on demand up to this number; the pool never shrinks, released workers are parked")
+    parser.add_option("--no-channelizer", action="store_false", dest="channelizer", default=True, help="run each logfile worker on the full input instead of a shared channelizer")
+    parser.add_option("--xlate", action="store_true", default=False, help="demodulators tune with a frequency translating filter")
+    parser.add_option("-S", "--sample-rate", type="int", default=320e3, help="source samp rate")
+    parser.add_option("-T", "--trunk-conf-file", type="string", default=None, help="trunking config file name")
+    parser.add_option("-v", "--verbosity", type="int", default=0, help="message debug level")
+    parser.add_option("-V", "--vocoder", action="store_true", default=False, help="voice codec")
+    parser.add_option("-o", "--offset", type="eng_float", default=0.0, help="tuning offset frequency [to circumvent DC offset]", metavar="Hz")
+    parser.add_option("-w", "--wireshark", action="store_true", default=False, help="output data to Wireshark")
+    parser.add_option("-W", "--wireshark-host", type="string", default="127.0.0.1", help="Wireshark host")
+    parser.add_option("-N", "--gains", type="string", default=None, help="gain settings")
+    parser.add_option("-O", "--audio-output", type="string", default="default", help="audio output device name")
+    parser.add_option("-q", "--freq-corr", type="eng_float", default=0.0, help="frequency correction")
+    parser.add_option("-2", "--phase2-tdma", action="store_true", default=False, help="enable phase2 tdma decode")
+    parser.add_option("--msgq-record", type="string", default=None, help="record decoder messages to file (see replay.py)")
+    parser.add_option("--latency-log", type="string", default=None, help="append grant to tune latency of each tune to file")
+    parser.add_option("--cache-dir", type="string", default=None, help="directory for the learned system state, loaded at startup, and the compiled trunk config (otherwise kept in ~/.cache/op25)")
+    parser.add_option("--status-interval", type="float", default=0, help="print trunking status every N seconds")
+    (options, args) = parser.parse_args()
+    if len(args) != 0:
+        parser.print_help()
+        sys.exit(1)
+    if not options.ifile and not options.frequency:
+        parser.error('a center frequency (-f) or input file (-F) is required')
+
+    tb = p25_rx_block(options)
+    tb.start()
+    try:
+        while True:
+            if options.status_interval:
+                time.sleep(options.status_interval)
+                print tb.status_string()
+            else:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        try:
+            tb.stop()
+            tb.wait()
+        finally:
+            if options.cache_dir:
+                with tb.trunk_rx.lock:	# the watcher may still be draining the queue
+                    tb.trunk_rx.save_state()
+            if tb.recorder is not None:
+                tb.du_watcher.recorder = None	# nor write to it any more
+                tb.recorder.close()
+            tb.trunk_rx.latency.close()
+
+if __name__ == '__main__':
+    main()
@@ -29,18 +29,14 @@ import pickle
 import sys
 import threading
 import wx
-import wx.html
-import wx.wizard
 import math
 import numpy
 import time
 import re
-try:
-    import Hamlib
-except:
-    pass
 
-from gnuradio import audio, eng_notation, gr, gru, filter, blocks, fft, analog, digital
+# wx.html, wx.wizard, Hamlib, osmosdr and gnuradio.audio are imported
+# where they are used, so startup does not pay for unused features
+from gnuradio import eng_notation, gr, gru, filter, blocks, fft, analog, digital
 from gnuradio.eng_option import eng_option
 from gnuradio.wxgui import stdgui2, fftsink2, scopesink2, form
 from math import pi
@@ -52,6 +48,8 @@ import op25_repeater
 import gnuradio.wxgui.plot as plot
 
 import trunking
+import msgq_record
+import worker_pool
 
 import p25_demodulator
 import p25_decoder
@@ -111,6 +109,9 @@ class p25_rx_block (stdgui2.std_top_block):
         parser.add_option("-H", "--hamlib-model", type="int", default=None, help="specify model for hamlib")
         parser.add_option("-s", "--seek", type="int", default=0, help="ifile seek in K")
         parser.add_option("-L", "--logfile-workers", type="int", default=None, help="number of demodulators to instantiate")
+        parser.add_option("--max-workers", type="int", default=None, help="grow the logfile workers on demand up to this number; the pool never shrinks, released workers are parked")
+        parser.add_option("--no-channelizer", action="store_false", dest="channelizer", default=True, help="run each logfile worker on the full input instead of a shared channelizer")
+        parser.add_option("--xlate", action="store_true", default=False, help="logfile workers tune with a frequency translating filter")
         parser.add_option("-S", "--sample-rate", type="int", default=320e3, help="source samp rate")
         parser.add_option("-t", "--tone-detect", action="store_true", default=False, help="use experimental tone detect algorithm")
         parser.add_option("-T", "--trunk-conf-file", type="string", default=None, help="trunking config file name")
@@ -129,6 +130,9 @@ class p25_rx_block (stdgui2.std_top_block):
         parser.add_option("-O", "--audio-output", type="string", default="default", help="audio output device name")
         parser.add_option("-q", "--freq-corr", type="eng_float", default=0.0, help="frequency correction")
         parser.add_option("-2", "--phase2-tdma", action="store_true", default=False, help="enable phase2 tdma decode")
+        parser.add_option("--msgq-record", type="string", default=None, help="record decoder messages to file (see replay.py)")
+        parser.add_option("--latency-log", type="string", default=None, help="append grant to tune latency of each tune to file")
+        parser.add_option("--cache-dir", type="string", default=None, help="directory for the learned system state, loaded at startup, and the compiled trunk config (otherwise kept in ~/.cache/op25)")
         (options, args) = parser.parse_args()
         if len(args) != 0:
             parser.print_help()
@@ -191,6 +195,7 @@ class p25_rx_block (stdgui2.std_top_block):
 
         # keep track of flow graph connections
         self.cnxns = []
+        self.recorder = None	# --msgq-record, closed at shutdown, after the flowgraph stops
 
         self.datascope_raw_input = False
         self.data_scope_connected = False
@@ -266,6 +271,7 @@ class p25_rx_block (stdgui2.std_top_block):
 
         if self.baseband_input:
             self.demod = p25_demodulator.p25_demod_fb(input_rate=capture_rate)
+            self.build_page(2)	# c4fm
             self.set_connection(c4fm=1)
         else:	# complex input
             # local osc
@@ -301,20 +307,26 @@ class p25_rx_block (stdgui2.std_top_block):
             self.connect(self.demod, self.sink_sf)
 
         logfile_workers = []
-        if self.options.phase2_tdma:
-            num_ambe = 2
-        if self.options.logfile_workers:
-            for i in xrange(self.options.logfile_workers):
-                demod = p25_demodulator.p25_demod_cb(input_rate=capture_rate,
-                                                     demod_type='cqpsk',	### FIXME
-                                                     offset=self.options.offset)
-                decoder = p25_decoder.p25_decoder_sink_b(debug = self.options.verbosity, do_imbe = self.options.vocoder, num_ambe=num_ambe)
-                logfile_workers.append({'demod': demod, 'decoder': decoder, 'active': False})
-                self.connect(source, demod, decoder)
-
-        self.trunk_rx = trunking.rx_ctl(frequency_set = self.change_freq, debug = self.options.verbosity, conf_file = self.options.trunk_conf_file, logfile_workers=logfile_workers)
-
-        self.du_watcher = du_queue_watcher(self.rx_q, self.trunk_rx.process_qmsg)
+        add_workers = None
+        self.worker_pool = None
+        if self.options.logfile_workers or self.options.max_workers:
+            if not self.options.logfile_workers:
+                self.options.logfile_workers = 1
+            self.worker_pool = worker_pool.worker_pool(self, source, capture_rate, self.options)
+            logfile_workers = self.worker_pool.workers
+            add_workers = self.worker_pool.add_workers
+
+        self.trunk_rx = trunking.rx_ctl(frequency_set = self.change_freq, debug = self.options.verbosity, conf_file = self.options.trunk_conf_file, logfile_workers=logfile_workers, latency_log=self.options.latency_log, state_dir=self.options.cache_dir, add_workers=add_workers)
+        if self.worker_pool is not None:	# initial workers, of the type the system needs
+            self.worker_pool.build_workers(self.options.logfile_workers, self.trunk_rx.worker_demod_type())
+
+        if self.recorder is not None:	# graph rebuilt by a file/usrp open
+            self.du_watcher.recorder = None
+            self.recorder.close()
+            self.recorder = None
+        if self.options.msgq_record:
+            self.recorder = msgq_record.msgq_recorder(self.options.msgq_record)
+        self.du_watcher = trunking.du_queue_watcher(self.rx_q, self.trunk_rx.process_qmsgs, recorder=self.recorder)
 
     # Connect up the flow graph
     #
@@ -400,6 +412,7 @@ class p25_rx_block (stdgui2.std_top_block):
             if fscope == 0:
                 self.demod.disconnect_float()
             else:
+                self.build_page(5)	# float_scope lives on the symbols page, traffic uses it too
                 self.demod.connect_float(self.float_scope)
 
         if fft != self.fft_state:
@@ -425,6 +438,7 @@ class p25_rx_block (stdgui2.std_top_block):
 
     def notebook_changed(self, evt):
         sel = self.notebook.GetSelection()
+        self.build_page(sel)
         self.lock()
         self.disconnect_data_scope()
         if not self.baseband_input:
@@ -458,7 +472,8 @@ class p25_rx_block (stdgui2.std_top_block):
         elif sel == 7:   # correlation
             self.disconnect_demods()
             self.current_speed = self.default_speed_idx # reset speed for corr
-            self.data_scope.win.radio_box_speed.SetSelection(self.current_speed)
+            if self.data_scope:
+                self.data_scope.win.radio_box_speed.SetSelection(self.current_speed)
             self.connect_fsk4_demod()
             self.set_connection(corr=1)
         elif sel == 8:   # fac - fast auto correlation
@@ -467,6 +482,92 @@ class p25_rx_block (stdgui2.std_top_block):
                 self.connect_demods()
         self.unlock()
 
+    # build the sink and window of notebook page sel, if not done yet
+    def build_page(self, sel):
+        page, builder = self.pages[sel]
+        if builder is None:
+            return
+        self.pages[sel][1] = None
+        page.GetSizer().Add(builder(page), 1, wx.EXPAND)
+        page.Layout()
+
+    def build_spectrum(self, parent):
+        #self.spectrum = fftsink2.fft_sink_c(parent, sample_rate = self.channel_rate, fft_size=512, fft_rate=2, average=False, peak_hold=False)
+        self.spectrum = fftsink2.fft_sink_c(parent, sample_rate = self.channel_rate, fft_size=1024, fft_rate=10, avg_alpha=0.35, ref_level=0, average=True, peak_hold=False)
+        try:
+            self.spectrum_plotter = self.spectrum.win.plotter
+        except:
+            self.spectrum_plotter = self.spectrum.win.plot
+        #self.spectrum_plotter.enable_point_label(False)
+        self.spectrum_plotter.Bind(wx.EVT_LEFT_DOWN, self._on_spectrum_left_click)
+        return self.spectrum.win
+
+    def build_chan_fft(self, parent):
+        self.chan_fft = fftsink2.fft_sink_c(
+            parent,
+            baseband_freq=0,
+            y_per_div=20,
+            y_divs=10,
+            ref_level=20,
+            ref_scale=1.0,
+            sample_rate=48000,
+            fft_size=2048,
+            fft_rate=15,
+            average=True,
+            avg_alpha=0.25,
+            title="Channel FFT",
+            peak_hold=False,
+        )
+        return self.chan_fft.win
+
+    def build_signal_scope(self, parent):
+        self.signal_scope = scopesink2.scope_sink_f(parent, sample_rate = self.basic_rate, v_scale=5, t_scale=0.001)
+        try:
+            self.signal_plotter = self.signal_scope.win.plotter
+        except:
+            self.signal_plotter = self.signal_scope.win.graph
+        return self.signal_scope.win
+
+    def build_data_scope(self, parent):
+        self.data_scope = datascope_sink_f(parent, samples_per_symbol = 10, num_plots = 100)
+        self.data_plotter = self.data_scope.win.graph
+        wx.EVT_RADIOBOX(self.data_scope.win.radio_box, 11103, self.filter_select)
+        wx.EVT_RADIOBOX(self.data_scope.win.radio_box_speed, 11104, self.speed_select)
+        self.data_scope.win.radio_box_speed.SetSelection(self.current_speed)
+        return self.data_scope.win
+
+    def build_complex_scope(self, parent):
+        self.complex_scope = constellation_plot_c(parent, title="Constellation", num_plots=250)
+        wx.EVT_RADIOBOX(self.complex_scope.win.radio_box_source, 11108, self.source_select)
+        return self.complex_scope.win
+
+    def build_float_scope(self, parent):
+        self.float_scope = scopesink2.scope_sink_f(parent, frame_decim=1, sample_rate=self.symbol_rate, v_scale=1, t_scale=0.05)
+        try:	#gl
+            self.float_plotter = self.float_scope.win.plotter
+            self.float_scope.win['marker_1'] = 3.0	# set type = large dots
+        except:	#nongl
+            self.float_plotter = self.float_scope.win.graph
+            self.float_scope.win.set_format_plus()
+        return self.float_scope.win
+
+    # Traffic snapshot
+    def build_traffic(self, parent):
+        self.traffic = TrafficPane(parent, trunk_traffic=True)
+        wx.EVT_BUTTON (self.traffic, 11109, self.update_traffic)
+        return self.traffic
+
+    def build_correlation_scope(self, parent):
+        self.correlation_scope = correlation_plot_f(parent, frame_decim=4, sps=10, v_scale=1, t_scale=0.05)
+        # self.correlation_plotter = self.correlation_scope.win.plotter
+        wx.EVT_RADIOBOX(self.correlation_scope.win.radio_box_corr, 11105, self.corr_select)
+        return self.correlation_scope.win
+
+    # fac - fast auto correlation
+    def build_fac_scope(self, parent):
+        self.fac_scope = fac_sink_c(parent, fac_size=2048, sample_rate=9600, average=True, avg_alpha=0.35, title="Auto Correlation")
+        return self.fac_scope.win
+
     # initialize the UI
     # 
     def __init_gui(self, frame, panel, vbox):
@@ -532,75 +633,37 @@ class p25_rx_block (stdgui2.std_top_block):
         else:
             self.toolbar = None
 
-        # setup the notebook
+        # setup the notebook.  Every page starts out as an empty panel; the
+        # sink and window of a page are built the first time it is selected
+        # (see build_page), so that unused plots cost neither startup time
+        # nor CPU
         self.notebook = wx.Notebook(self.panel)
         self.vbox.Add(self.notebook, 1, wx.EXPAND)       
-        # add spectrum scope
-        #self.spectrum = fftsink2.fft_sink_c(self.notebook, sample_rate = self.channel_rate, fft_size=512, fft_rate=2, average=False, peak_hold=False)
-        self.spectrum = fftsink2.fft_sink_c(self.notebook, sample_rate = self.channel_rate, fft_size=1024, fft_rate=10, avg_alpha=0.35, ref_level=0, average=True, peak_hold=False)
-        try:
-            self.spectrum_plotter = self.spectrum.win.plotter
-        except:
-            self.spectrum_plotter = self.spectrum.win.plot
-        #self.spectrum_plotter.enable_point_label(False)
-        self.spectrum_plotter.Bind(wx.EVT_LEFT_DOWN, self._on_spectrum_left_click)
-        self.notebook.AddPage(self.spectrum.win, "Spectrum")
-        # add channel fft
-        self.chan_fft = fftsink2.fft_sink_c(
-            self.notebook,
-            baseband_freq=0,
-            y_per_div=20,
-            y_divs=10,
-            ref_level=20,
-            ref_scale=1.0,
-            sample_rate=48000,
-            fft_size=2048,
-            fft_rate=15,
-            average=True,
-            avg_alpha=0.25,
-            title="Channel FFT",
-            peak_hold=False,
-        )
-        self.notebook.AddPage(self.chan_fft.win, "Channel")
-        # add C4FM scope
-        self.signal_scope = scopesink2.scope_sink_f(self.notebook, sample_rate = self.basic_rate, v_scale=5, t_scale=0.001)
-        try:
-            self.signal_plotter = self.signal_scope.win.plotter
-        except:
-            self.signal_plotter = self.signal_scope.win.graph
-        self.notebook.AddPage(self.signal_scope.win, "C4FM")
-        # add datascope
-        self.data_scope = datascope_sink_f(self.notebook, samples_per_symbol = 10, num_plots = 100)
-        self.data_plotter = self.data_scope.win.graph
-        wx.EVT_RADIOBOX(self.data_scope.win.radio_box, 11103, self.filter_select)
-        wx.EVT_RADIOBOX(self.data_scope.win.radio_box_speed, 11104, self.speed_select)
-        self.data_scope.win.radio_box_speed.SetSelection(self.current_speed)
-        self.notebook.AddPage(self.data_scope.win, "Datascope")
-        # add complex scope
-        self.complex_scope = constellation_plot_c(self.notebook, title="Constellation", num_plots=250)
-        self.notebook.AddPage(self.complex_scope.win, "Constellation")
-        wx.EVT_RADIOBOX(self.complex_scope.win.radio_box_source, 11108, self.source_select)
-        # add float scope
-        self.float_scope = scopesink2.scope_sink_f(self.notebook, frame_decim=1, sample_rate=self.symbol_rate, v_scale=1, t_scale=0.05)
-        try:	#gl
-            self.float_plotter = self.float_scope.win.plotter
-            self.float_scope.win['marker_1'] = 3.0	# set type = large dots
-        except:	#nongl
-            self.float_plotter = self.float_scope.win.graph
-            self.float_scope.win.set_format_plus()
-        self.notebook.AddPage(self.float_scope.win, "Symbols")
-        # Traffic snapshot
-        self.traffic = TrafficPane(self.notebook, trunk_traffic=True)
-        self.notebook.AddPage(self.traffic, "Traffic")
-        wx.EVT_BUTTON (self.traffic, 11109, self.update_traffic)
-        # add corr scope
-        self.correlation_scope = correlation_plot_f(self.notebook, frame_decim=4, sps=10, v_scale=1, t_scale=0.05)
-        # self.correlation_plotter = self.correlation_scope.win.plotter
-        wx.EVT_RADIOBOX(self.correlation_scope.win.radio_box_corr, 11105, self.corr_select)
-        self.notebook.AddPage(self.correlation_scope.win, "Correlation")
-        # add fac scope
-        self.fac_scope = fac_sink_c(self.notebook, fac_size=2048, sample_rate=9600, average=True, avg_alpha=0.35, title="Auto Correlation")
-        self.notebook.AddPage(self.fac_scope.win, "FAC")
+        self.spectrum = None
+        self.chan_fft = None
+        self.signal_scope = None
+        self.signal_plotter = None
+        self.data_scope = None
+        self.complex_scope = None
+        self.float_scope = None
+        self.traffic = None
+        self.correlation_scope = None
+        self.fac_scope = None
+        self.pages = []
+        for title, builder in [("Spectrum", self.build_spectrum),
+                               ("Channel", self.build_chan_fft),
+                               ("C4FM", self.build_signal_scope),
+                               ("Datascope", self.build_data_scope),
+                               ("Constellation", self.build_complex_scope),
+                               ("Symbols", self.build_float_scope),
+                               ("Traffic", self.build_traffic),
+                               ("Correlation", self.build_correlation_scope),
+                               ("FAC", self.build_fac_scope)]:
+            page = wx.Panel(self.notebook)
+            page.SetSizer(wx.BoxSizer(wx.VERTICAL))
+            self.notebook.AddPage(page, title)
+            self.pages.append([page, builder])
+        self.build_page(0)	# the spectrum is shown first
         # Setup the decoder and report the TUN/TAP device name
         msgq = gr.msg_queue(2)
         # self.decode_watcher = decode_watcher(msgq, self.traffic)
@@ -746,6 +809,7 @@ class p25_rx_block (stdgui2.std_top_block):
         wx.PostEvent(self.frame, evt)
 
     def hamlib_attach(self, model):
+        import Hamlib
         Hamlib.rig_set_debug (Hamlib.RIG_DEBUG_NONE)	# RIG_DEBUG_TRACE
 
         self.hamlib = Hamlib.Rig (model)
@@ -773,6 +837,7 @@ class p25_rx_block (stdgui2.std_top_block):
 
     def update_traffic(self, evt):
         s = self.trunk_rx.to_string()
+        s += '\nmessage queue drops %d\n' % self.decoder.get_msgq_drops()
         t = {}
 	t['string'] = s
         self.traffic.update(t)
@@ -919,7 +984,8 @@ class p25_rx_block (stdgui2.std_top_block):
             self.frame.SetStatusText("", 1)
             self.frame.SetStatusText("", 2)
             self.spectrum_plotter.ClearBackground()
-            self.signal_plotter.ClearBackground()
+            if self.signal_plotter:
+                self.signal_plotter.ClearBackground()
             # self.symbol_plotter.ClearBackground()
             # self.traffic.clear()
         elif "RUNNING" == self.state:
@@ -988,6 +1054,7 @@ class p25_rx_block (stdgui2.std_top_block):
     # New capture from USRP 
     #
     def _on_file_new(self, event):
+#         wizard_intro_page, wizard_details_page = wizard_page_classes()
 #         wizard = wx.wizard.Wizard(self.frame, -1, "New Capture from USRP")
 #         page1 = wizard_intro_page(wizard)
 #         page2 = wizard_details_page(wizard)
@@ -1119,6 +1186,7 @@ class p25_rx_block (stdgui2.std_top_block):
                 "center-freq": 0,
                 "source-dev": "AUDIO",
                 "source-decim": 1 }
+        from gnuradio import audio
         self.audio_source = audio.source(capture_rate, audio_input_filename)
         self.audio_cvt = blocks.float_to_complex()
         self.connect((self.audio_source, 0), (self.audio_cvt, 0))
@@ -1135,6 +1203,7 @@ class p25_rx_block (stdgui2.std_top_block):
                 "center-freq": 0,
                 "source-dev": "AUDIO",
                 "source-decim": 1 }
+            from gnuradio import audio
             self.source = audio.source(capture_rate, audio_input_filename)
             self.__set_rx_from_audio(capture_rate)
             self._set_titlebar("Capturing")
@@ -1383,16 +1452,22 @@ class TrafficPane(wx.Panel):
                 v.SetValue("")
 
 
-# Introduction page for USRP capture wizard
-#
-class wizard_intro_page(wx.wizard.WizardPageSimple):
+# USRP capture wizard pages; wx.html and wx.wizard are only imported
+# when the wizard is used
+def wizard_page_classes():
+    import wx.html
+    import wx.wizard
 
-    # Initializer
+    # Introduction page for USRP capture wizard
     #
-    def __init__(self, parent):
-        wx.wizard.WizardPageSimple.__init__(self, parent)
-        html = wx.html.HtmlWindow(self)
-        html.SetPage('''
+    class wizard_intro_page(wx.wizard.WizardPageSimple):
+
+        # Initializer
+        #
+        def __init__(self, parent):
+            wx.wizard.WizardPageSimple.__init__(self, parent)
+            html = wx.html.HtmlWindow(self)
+            html.SetPage('''
 	<html>
 	 <body>
          <h1>Capture from USRP</h1>
@@ -1403,44 +1478,29 @@ class wizard_intro_page(wx.wizard.WizardPageSimple):
 	 </body>
 	</html>
 	''')
-        sizer = wx.BoxSizer(wx.VERTICAL)
-        self.SetSizer(sizer)
-        sizer.Add(html, 1, wx.ALIGN_CENTER | wx.EXPAND | wx.FIXED_MINSIZE)
-
-
-# USRP wizard details page
-#
-class wizard_details_page(wx.wizard.WizardPageSimple):
+            sizer = wx.BoxSizer(wx.VERTICAL)
+            self.SetSizer(sizer)
+            sizer.Add(html, 1, wx.ALIGN_CENTER | wx.EXPAND | wx.FIXED_MINSIZE)
 
-    # Initializer
-    #
-    def __init__(self, parent):
-        wx.wizard.WizardPageSimple.__init__(self, parent)
-        sizer = wx.BoxSizer(wx.VERTICAL)
-        self.SetSizer(sizer)
 
-    # Return a tuple containing the subdev_spec, gain, frequency, decimation factor
+    # USRP wizard details page
     #
-    def get_details(self):
-        ToDo = True
+    class wizard_details_page(wx.wizard.WizardPageSimple):
 
+        # Initializer
+        #
+        def __init__(self, parent):
+            wx.wizard.WizardPageSimple.__init__(self, parent)
+            sizer = wx.BoxSizer(wx.VERTICAL)
+            self.SetSizer(sizer)
 
-# data unit receive queue
-#
-class du_queue_watcher(threading.Thread):
+        # Return a tuple containing the subdev_spec, gain, frequency, decimation factor
+        #
+        def get_details(self):
+            ToDo = True
 
-    def __init__(self, msgq,  callback, **kwds):
-        threading.Thread.__init__ (self, **kwds)
-        self.setDaemon(1)
-        self.msgq = msgq
-        self.callback = callback
-        self.keep_running = True
-        self.start()
+    return wizard_intro_page, wizard_details_page
 
-    def run(self):
-        while(self.keep_running):
-            msg = self.msgq.delete_head()
-            self.callback(msg)
 
 # Frequency tracker
 #
@@ -2782,4 +2842,9 @@ def make_fac_sink_c(fg, parent, title, fac_size, input_rate, ymin=0, ymax=50):
 #
 if '__main__' == __name__:
     app = stdgui2.stdapp(p25_rx_block, "APCO P25 Receiver", 3)
+    tb = app.GetTopWindow().top_block()
     app.MainLoop()
+    tb.wait()	# stopped by the frame on close
+    if tb.recorder is not None:
+        tb.du_watcher.recorder = None	# the watcher may still be draining the queue
+        tb.recorder.close()
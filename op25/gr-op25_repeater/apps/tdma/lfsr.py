@@ -21,69 +21,104 @@
 import numpy as np
 from bit_utils import *
 
-class p25p2_lfsr(object):
-	def __init__(self,nac,sysid,wacn):
-		xorbits = self.mk_xor_bits(nac,sysid,wacn)
-		#self.xorsyms = np.zeros(len(xorbits)/2)
-		self.xorsyms = [0] * (len(xorbits)/2)
-		for i in xrange(len(self.xorsyms)):
-			self.xorsyms[i] = (xorbits[i*2] << 1) + xorbits[i*2+1]
-		self.xor_chars = ''.join([chr(c) for c in self.xorsyms])
+# the 44x44 GF(2) matrix applied to the (wacn, sysid, nac) seed to form
+# the initial register
+LFSR_SEED_MATRIX = np.array([[int(b) for b in row.split()] for row in (
+	'1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 0 0 0 0 0 0; 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 0 0 0 0 0; 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 0 0 0 0; 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 0 0 0; 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 0 0; 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 0; 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0; 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0; 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0; 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1; 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1').split(';')], dtype=np.uint8)
 
-	def asm_reg(self,s1,s2,s3,s4,s5,s6):
-		s1 = s1 & 0xfL
-		s2 = s2 & 0x1fL
-		s3 = s3 & 0x3fL
-		s4 = s4 & 0x1fL
-		s5 = s5 & 0x3fffL
-		s6 = s6 & 0x3ffL
-		return (s1<<40)+(s2<<35)+(s3<<29)+(s4<<24)+(s5<<10)+s6
+LFSR_BITS = 4320	# mask length in bits
 
-	def disasm_reg(self,r):
-		s1 = (r>>40) & 0xfL
-		s2 = (r>>35) & 0x1fL
-		s3 = (r>>29) & 0x3fL
-		s4 = (r>>24) & 0x1fL
-		s5 = (r>>10) & 0x3fffL
-		s6 =  r      & 0x3ffL
-		return s1,s2,s3,s4,s5,s6
+def asm_reg(s1,s2,s3,s4,s5,s6):
+	s1 = s1 & 0xfL
+	s2 = s2 & 0x1fL
+	s3 = s3 & 0x3fL
+	s4 = s4 & 0x1fL
+	s5 = s5 & 0x3fffL
+	s6 = s6 & 0x3ffL
+	return (s1<<40)+(s2<<35)+(s3<<29)+(s4<<24)+(s5<<10)+s6
 
-	def cyc_reg(self, reg):
-		s1,s2,s3,s4,s5,s6 = self.disasm_reg(reg)
-		cy1 = (s1 >> 3) & 1L
-		cy2 = (s2 >> 4) & 1L
-		cy3 = (s3 >> 5) & 1L
-		cy4 = (s4 >> 4) & 1L
-		cy5 = (s5 >> 13) & 1L
-		cy6 = (s6 >> 9) & 1L
-		x1 = cy1 ^ cy2
-		x2 = cy1 ^ cy3
-		x3 = cy1 ^ cy4
-		x4 = cy1 ^ cy5
-		x5 = cy1 ^ cy6
-		s1 = (s1 << 1) & 0xfL
-		s2 = (s2 << 1) & 0x1fL
-		s3 = (s3 << 1) & 0x3fL
-		s4 = (s4 << 1) & 0x1fL
-		s5 = (s5 << 1) & 0x3fffL
-		s6 = (s6 << 1) & 0x3ffL
-		s1 = s1 | (x1 & 1L)
-		s2 = s2 | (x2 & 1L)
-		s3 = s3 | (x3 & 1L)
-		s4 = s4 | (x4 & 1L)
-		s5 = s5 | (x5 & 1L)
-		s6 = s6 | (cy1 & 1L)
-		return self.asm_reg(s1,s2,s3,s4,s5,s6)
+def disasm_reg(r):
+	s1 = (r>>40) & 0xfL
+	s2 = (r>>35) & 0x1fL
+	s3 = (r>>29) & 0x3fL
+	s4 = (r>>24) & 0x1fL
+	s5 = (r>>10) & 0x3fffL
+	s6 =  r      & 0x3ffL
+	return s1,s2,s3,s4,s5,s6
 
-	def mk_xor_bits(self, nac,sysid,wacn):
-		reg = mk_array(16777216*wacn + 4096*sysid + nac, 44)
+def cyc_reg(reg):
+	s1,s2,s3,s4,s5,s6 = disasm_reg(reg)
+	cy1 = (s1 >> 3) & 1L
+	cy2 = (s2 >> 4) & 1L
+	cy3 = (s3 >> 5) & 1L
+	cy4 = (s4 >> 4) & 1L
+	cy5 = (s5 >> 13) & 1L
+	cy6 = (s6 >> 9) & 1L
+	x1 = cy1 ^ cy2
+	x2 = cy1 ^ cy3
+	x3 = cy1 ^ cy4
+	x4 = cy1 ^ cy5
+	x5 = cy1 ^ cy6
+	s1 = (s1 << 1) & 0xfL
+	s2 = (s2 << 1) & 0x1fL
+	s3 = (s3 << 1) & 0x3fL
+	s4 = (s4 << 1) & 0x1fL
+	s5 = (s5 << 1) & 0x3fffL
+	s6 = (s6 << 1) & 0x3ffL
+	s1 = s1 | (x1 & 1L)
+	s2 = s2 | (x2 & 1L)
+	s3 = s3 | (x3 & 1L)
+	s4 = s4 | (x4 & 1L)
+	s5 = s5 | (x5 & 1L)
+	s6 = s6 | (cy1 & 1L)
+	return asm_reg(s1,s2,s3,s4,s5,s6)
+
+def gf2(a):	# a float64 matrix product, reduced mod 2
+	return (a.astype(np.uint8) & 1).astype(np.float64)
+
+def mk_mask_matrix():
+	# cyc_reg is linear over GF(2), so every mask bit is a fixed parity of
+	# the 44 seed bits.  Returns the (LFSR_BITS, 44) matrix G with
+	# mask = G . seed (mod 2), seed bits msb first as from mk_array.
+	# Register bits are indexed msb first too (index k is bit 43-k), so the
+	# output bit (bit 43) is index 0.  Products are done in float64, which
+	# holds the small integer sums exactly and goes through BLAS
+	A = np.zeros((44, 44))	# one register step
+	for k in xrange(44):
+		A[:, k] = mk_array(cyc_reg(1L << (43 - k)), 44)
+	# rows 0-63: row 0 of A**i, one step at a time; later blocks of 64
+	# follow by multiplying the previous block by A**64
+	block = np.zeros((64, 44))
+	block[0, 0] = 1
+	for i in xrange(1, 64):
+		block[i] = gf2(np.dot(block[i-1], A))
+	A64 = A
+	for i in xrange(6):
+		A64 = gf2(np.dot(A64, A64))
+	blocks = [block]
+	for i in xrange(1, (LFSR_BITS + 63) / 64):
+		blocks.append(gf2(np.dot(blocks[-1], A64)))
+	G = np.vstack(blocks)[:LFSR_BITS]
+	# fold in the seed matrix: register = seed . M, i.e. M.T . seed
+	return np.dot(G, LFSR_SEED_MATRIX.T.astype(np.float64)).astype(np.uint8) & 1
 
-		M = np.array(np.mat('1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 0 0 0 0 0 0; 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 0 0 0 0 0; 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 0 0 0 0; 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 0 0 0; 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 0 0; 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 0; 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0; 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0; 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0; 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 1; 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0 1; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0 1; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0 1; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0 1; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1 0; 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 1'))
-		reg = mk_int(np.dot(reg,M))
+LFSR_MASK_MATRIX = mk_mask_matrix()
+# the mask as dibit symbols is just as linear: row j is the symbol mask
+# of seed bit j alone, and a seed's mask is the xor of the rows of its
+# set bits.  The rows are xored 8 symbols at a time, as uint64
+LFSR_SYM_MATRIX = ((LFSR_MASK_MATRIX[0::2] << 1) | LFSR_MASK_MATRIX[1::2]).T.copy()
+LFSR_SYM_MATRIX64 = LFSR_SYM_MATRIX.view(np.uint64)
+LFSR_SEED_SHIFTS = np.arange(43, -1, -1, dtype=np.int64)
 
-		s = []
-		for i in xrange(4320):
-			s.append((reg >> 43) & 1)
-			reg = self.cyc_reg(reg)
+def seed_bits(nac, sysid, wacn):	# msb first, as mk_array
+	return (np.int64(16777216*wacn + 4096*sysid + nac) >> LFSR_SEED_SHIFTS) & 1
 
-		return s
+class p25p2_lfsr(object):
+	def __init__(self,nac,sysid,wacn):
+		syms = np.bitwise_xor.reduce(LFSR_SYM_MATRIX64[seed_bits(nac,sysid,wacn) == 1], axis=0).view(np.uint8)
+		self.xorsyms = syms	# uint8 array of dibits
+		self.xor_chars = syms.tostring()
+
+	def mk_xor_bits(self, nac,sysid,wacn):
+		# the first LFSR_BITS output bits of the register
+		return (np.dot(LFSR_MASK_MATRIX, seed_bits(nac,sysid,wacn)) & 1).tolist()
@@ -19,24 +19,140 @@
 # 02110-1301, USA.
 #
 
+import os
 import sys
 import time
+import threading
+import cPickle as pickle
 import collections
+import heapq
+import bisect
+import struct
+import zlib
+import numpy as np
 sys.path.append('tdma')
 import lfsr
 
-def crc16(dat,len):	# slow version
-    poly = (1<<12) + (1<<5) + (1<<0)
+def mk_crc16_table():
+    # CRC-16/CCITT, polynomial x^16 + x^12 + x^5 + 1.  Entry h holds the
+    # remainder of h * x^16, i.e. the effect of the high byte shifted out
+    poly = (1<<16) + (1<<12) + (1<<5) + (1<<0)
+    table = []
+    for h in xrange(256):
+        crc = h << 16
+        for bit in xrange(23, 15, -1):
+            if crc & (1 << bit):
+                crc ^= poly << (bit - 16)
+        table.append(crc)
+    return table
+
+CRC16_TABLE = mk_crc16_table()
+
+def crc16(dat,len):	# byte-wise, table driven
     crc = 0
-    for i in range(len):
-        bits = (dat >> (((len-1)-i)*8)) & 0xff
-        for j in range(8):
-            bit = (bits >> (7-j)) & 1
-            crc = ((crc << 1) | bit) & 0x1ffff
-            if crc & 0x10000:
-                crc = (crc & 0xffff) ^ poly
-    crc = crc ^ 0xffff
-    return crc
+    for shift in xrange((len-1)*8, -8, -8):
+        crc = (((crc & 0xff) << 8) | ((dat >> shift) & 0xff)) ^ CRC16_TABLE[crc >> 8]
+    return crc ^ 0xffff
+
+def mk_crc16_fixed(len):
+    # crc16() unrolled for a fixed message length.  The remainder is
+    # linear in the message, so each byte position gets its own table
+    # and the result is the xor of one lookup per byte
+    tables = []
+    for i in xrange(len):
+        tables.append([crc16(b << (i*8), len) ^ 0xffff for b in xrange(256)])
+    expr = ' ^ '.join(['t[%d][(v >> %d) & 0xff]' % (i, i*8) for i in xrange(len)])
+    return eval('lambda v, t=tables: %s ^ 0xffff' % expr, {'tables': tables})
+
+crc16_tsbk = mk_crc16_fixed(12)	# 96-bit TSBK including crc, zero if valid
+
+def mk_crc32_table():
+    # the crc32() of p25p1_fdma.cc (polynomial 0x04c11db7, msb first,
+    # zero initial value), a byte at a time
+    poly = 0x04c11db7
+    table = []
+    for h in xrange(256):
+        crc = h << 24
+        for bit in xrange(8):
+            crc = ((crc << 1) ^ (poly if crc & 0x80000000 else 0)) & 0xffffffff
+        table.append(crc)
+    return table
+
+CRC32_TABLE = mk_crc32_table()
+
+def crc32(dat,len):	# byte-wise, table driven
+    crc = 0
+    for shift in xrange((len-1)*8, -8, -8):
+        crc = ((crc << 8) & 0xffffffff) ^ CRC32_TABLE[(crc >> 24) ^ ((dat >> shift) & 0xff)]
+    return crc ^ 0xffffffff
+
+def tsbk_crc_ok(tsbk, crc=None):
+    # the acceptance rule of the p25p1_fdma.cc TSBK decoder: a valid
+    # crc16, or else a crc32 of the first 64 bits in the last 32.  crc is
+    # the crc16_tsbk() of the block if already known (crc16_batch).  The
+    # crc32 is only computed for blocks that fail the crc16
+    if crc is None:
+        crc = crc16_tsbk(tsbk)
+    return crc == 0 or crc32(tsbk >> 32, 8) == tsbk & 0xffffffff
+
+CRC16_NP_FIXED = {}	# message length -> per byte position tables
+
+def crc16_batch(blocks):
+    # crc16() of each row of an (n, len) uint8 array.  As in
+    # mk_crc16_fixed, one table lookup per byte position, xored together
+    blocks = np.asarray(blocks, dtype=np.uint8)
+    len = blocks.shape[1]
+    if len not in CRC16_NP_FIXED:
+        CRC16_NP_FIXED[len] = np.array([[crc16(b << (i*8), len) ^ 0xffff for b in xrange(256)] for i in xrange(len-1, -1, -1)], dtype=np.uint16)
+    tables = CRC16_NP_FIXED[len]
+    return np.bitwise_xor.reduce(tables[np.arange(len), blocks], axis=1) ^ 0xffff
+
+# msgq payloads: big-endian nac followed by the 96-bit TSBK, or by the
+# 96-bit MBT header and one 96-bit data block
+QMSG_NAC = struct.Struct('>H')
+QMSG_TSBK = struct.Struct('>HQI')
+QMSG_MBT = struct.Struct('>HQIQI')
+QMSG_DTYPE = np.dtype([('nac', '>u2'), ('hi', '>u8'), ('lo', '>u4'), ('data_hi', '>u8'), ('data_lo', '>u4')])
+QMSG_BATCH_MIN = 16	# batch size from which qmsg_array and crc16_batch beat struct
+
+def qmsg_array(msgs):
+    # decode a batch of queued messages into a structured array, one
+    # record per message.  Payloads are zero padded to QMSG_DTYPE; records
+    # of messages without payload (type < 0) are all zero
+    types = np.array([msg.type() for msg in msgs], dtype=np.int32)
+    size = QMSG_DTYPE.itemsize
+    buf = ''.join([msg.to_string()[:size].ljust(size, '\0') if msg.type() >= 0 else '\0' * size for msg in msgs])
+    return types, np.frombuffer(buf, dtype=QMSG_DTYPE)
+
+def qmsg_tsbks(recs):
+    # 96-bit TSBK values and their crc16() (zero if valid) for records of type 7
+    raw = recs.view(np.uint8).reshape(len(recs), QMSG_DTYPE.itemsize)
+    tsbks = [(hi << 32) | lo for hi, lo in zip(recs['hi'].tolist(), recs['lo'].tolist())]
+    return tsbks, crc16_batch(raw[:, 2:14]).tolist()
+
+def qmsg_decode(msgs):
+    # nac, 96-bit TSBK and its crc16() of each message of a drained batch,
+    # as lists (zero for messages without payload, meaningless for other
+    # types).  A short batch is unpacked message by message and its crcs
+    # are left to decode_tsbk (None), a long one (a backlog after a stall)
+    # is decoded in one go through qmsg_array and crc16_batch
+    if len(msgs) >= QMSG_BATCH_MIN:
+        types, recs = qmsg_array(msgs)
+        tsbks, crcs = qmsg_tsbks(recs)
+        return recs['nac'].tolist(), tsbks, crcs
+    nacs = []
+    tsbks = []
+    for msg in msgs:
+        type = msg.type()
+        nac = tsbk = 0
+        if type == 7:
+            nac, hi, lo = QMSG_TSBK.unpack_from(msg.to_string())
+            tsbk = (hi << 32) | lo
+        elif type >= 0:
+            nac = QMSG_NAC.unpack_from(msg.to_string())[0]
+        nacs.append(nac)
+        tsbks.append(tsbk)
+    return nacs, tsbks, None
 
 def get_frequency(f):	# return frequency in Hz
     if f.find('.') == -1:	# assume in Hz
@@ -60,15 +176,245 @@ def get_data_srv_options(options): #Data Service Options : TIA-102.AABC-C page 3
     M = (options >> 4) & 0x1 #  Mode: 0 = Circuit mode, 1 = Packet mode
     return (NSAPI,E,P,D,M)
 
+def mk_extractor(fields):
+    # compile a list of (shift, mask) pairs into one function returning a tuple
+    return eval('lambda v: (%s,)' % ', '.join(['(v >> %d) & 0x%x' % (shift, mask) for shift, mask in fields]))
+
+def mk_dispatch(handlers):
+    # build a flat table indexed by (opcode << 8) | mfrid.  Entries with
+    # mfrid None apply to every manufacturer unless a specific entry exists
+    table = [None] * 0x4000
+    for (opcode, mfrid), handler in handlers:
+        if mfrid is None:
+            for i in xrange(0x100):
+                if table[(opcode << 8) | i] is None:
+                    table[(opcode << 8) | i] = handler
+        else:
+            table[(opcode << 8) | mfrid] = handler
+    return table
+
+NO_CHANNEL = (None, None)	# channel id with no known IDEN_UP
+UNBUILT_CHANNELS = [None] * 0x1000
+
+# TSBK field extractors, (shift, mask) pairs relative to the 96-bit TSBK
+TSBK_GRP_V_CH_GRANT = mk_extractor([(72, 0xff), (56, 0xffff), (40, 0xffff), (16, 0xffffff)])	# opts ch ga sa
+TSBK_MOT_GRG_CMD = mk_extractor([(64, 0xffff), (48, 0xffff), (32, 0xffff), (16, 0xffff)])	# sg ga1 ga2 ga3
+TSBK_MOT_GRG_CN_GRANT = mk_extractor([(56, 0xffff), (40, 0xffff), (16, 0xffffff)])	# ch sg sa
+TSBK_GRP_V_CH_GRANT_UPDT = mk_extractor([(64, 0xffff), (48, 0xffff), (32, 0xffff), (16, 0xffff)])	# ch1 ga1 ch2 ga2
+TSBK_GRP_V_CH_GRANT_UPDT_EXP = mk_extractor([(72, 0xff), (48, 0xffff), (32, 0xffff), (16, 0xffff)])	# opts ch1 ch2 ga
+TSBK_SNDCP_DATA_CH = mk_extractor([(48, 0xffff), (32, 0xffff)])	# ch1 ch2
+TSBK_IDEN_UP_VU = mk_extractor([(76, 0xf), (72, 0xf), (58, 0x3fff), (48, 0x3ff), (16, 0xffffffff)])	# iden bwvu toff spac freq
+TSBK_IDEN_UP_TDMA = mk_extractor([(76, 0xf), (72, 0xf), (58, 0x3fff), (48, 0x3ff), (16, 0xffffffff)])	# iden type toff spac freq
+TSBK_IDEN_UP = mk_extractor([(76, 0xf), (67, 0x1ff), (58, 0x1ff), (48, 0x3ff), (16, 0xffffffff)])	# iden bw toff spac freq
+TSBK_RFSS_STS_BCST = mk_extractor([(56, 0xfff), (48, 0xff), (40, 0xff), (24, 0xffff)])	# syid rfid stid ch
+TSBK_SCCB = mk_extractor([(72, 0xff), (64, 0xff), (48, 0xffff), (24, 0xffff)])	# rfid stid ch1 ch2
+TSBK_NET_STS_BCST = mk_extractor([(52, 0xfffff), (40, 0xfff), (24, 0xffff)])	# wacn syid ch
+TSBK_ADJ_STS_BCST = mk_extractor([(48, 0xff), (40, 0xff), (24, 0xffff)])	# rfid stid ch
+
+# MBT field extractors, applied to the 96-bit header or the data block
+MBT_HDR_SRV_OPTIONS = mk_extractor([(24, 0xff)])	# opts
+MBT_HDR_SYID = mk_extractor([(48, 0xfff)])	# syid
+MBT_HDR_ADJ_STS = mk_extractor([(48, 0xfff), (24, 0xff), (16, 0xff)])	# syid rfid stid
+MBT_GRP_V_CH_GRANT = mk_extractor([(64, 0xffff), (48, 0xffff), (32, 0xffff)])	# ch1 ch2 ga
+MBT_ADJ_STS_BCST = mk_extractor([(80, 0xffff), (64, 0xffff)])	# ch1 ch2
+MBT_NET_STS_BCST = mk_extractor([(76, 0xfffff), (56, 0xffff), (40, 0xffff)])	# wacn ch1 ch2
+MBT_RFSS_STS_BCST = mk_extractor([(88, 0xff), (80, 0xff), (64, 0xffff), (48, 0xffff)])	# rfid stid ch1 ch2
+
+class sorted_dict(dict):
+    # dict that iterates in key order; new keys are placed by bisection
+    # so inserts never re-sort and rewriting an existing key is plain dict cost
+    def __init__(self):
+        dict.__init__(self)
+        self.sorted_keys = []
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            bisect.insort(self.sorted_keys, key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        del self.sorted_keys[bisect.bisect_left(self.sorted_keys, key)]
+
+    def pop(self, key, *default):
+        if key in self:
+            del self.sorted_keys[bisect.bisect_left(self.sorted_keys, key)]
+        return dict.pop(self, key, *default)
+
+    def __iter__(self):
+        return iter(self.sorted_keys)
+
+    def keys(self):
+        return self.sorted_keys[:]
+
+    def items(self):
+        return [(k, self[k]) for k in self.sorted_keys]
+
+    def iteritems(self):
+        return ((k, self[k]) for k in self.sorted_keys)
+
+    def values(self):
+        return [self[k] for k in self.sorted_keys]
+
+# decode and scheduler profiling.  Counts, total time and a log2 time
+# histogram (bin b counts events that took under 2**b us) per key, in
+# lists allocated up front so that recording an event allocates nothing
+PROFILE_BINS = 16
+
+profile_entry = collections.namedtuple('profile_entry', 'name count total hist')	# total in seconds
+tsys_profile = collections.namedtuple('tsys_profile', 'messages handlers')	# [(name, count)], [profile_entry]
+rx_profile = collections.namedtuple('rx_profile', 'systems commands latency')	# {nac: tsys_profile}, [profile_entry], [profile_entry]
+
+class decode_profile(object):
+    def __init__(self, names, bins=PROFILE_BINS):
+        self.names = names
+        self.bins = bins
+        self.counts = [0] * len(names)
+        self.total = [0.0] * len(names)
+        self.hist = [0] * (len(names) * bins)
+
+    def add(self, key, dt):
+        self.counts[key] += 1
+        self.total[key] += dt
+        b = int(dt * 1e6).bit_length()
+        if b >= self.bins:
+            b = self.bins - 1
+        self.hist[key * self.bins + b] += 1
+
+    def snapshot(self):
+        return [profile_entry(self.names[k], self.counts[k], self.total[k], tuple(self.hist[k * self.bins:(k + 1) * self.bins]))
+                for k in xrange(len(self.names)) if self.counts[k]]
+
+def hist_percentile(hist, frac):	# upper bound in us
+    target = frac * sum(hist)
+    n = 0
+    for b in xrange(len(hist)):
+        n += hist[b]
+        if n >= target:
+            return 1 << b
+    return 1 << (len(hist) - 1)
+
+def profile_lines(entries):
+    s = ['%-28s %9s %10s %8s %8s %8s' % ('', 'count', 'total ms', 'mean us', 'p50 <us', 'p99 <us')]
+    for e in entries:
+        s.append('%-28s %9d %10.1f %8.1f %8d %8d' % (e.name, e.count, e.total * 1e3, e.total * 1e6 / e.count, hist_percentile(e.hist, 0.5), hist_percentile(e.hist, 0.99)))
+    return s
+
+# trunked_system profile keys; the dispatch handlers follow these
+PROFILE_TSBK_OTHER = 0
+PROFILE_MBT_OTHER = 1
+PROFILE_CRC = 2
+PROFILE_CACHE_HIT = 3
+PROFILE_NAMES = ['tsbk other', 'mbt other', 'crc error', 'grant cache hit']
+
+def mk_profile_index(table, names, other):
+    # profile key of each dispatch table entry, adding a name to names
+    # for every handler not seen before
+    index = []
+    keys = {}
+    for handler in table:
+        if handler is None:
+            index.append(other)
+            continue
+        if handler not in keys:
+            keys[handler] = len(names)
+            names.append(handler.__name__)
+        index.append(keys[handler])
+    return index
+
+# rx_ctl profile keys
+RX_PROFILE_NAMES = ['other command', 'timeout', 'update', 'duid0', 'duid3', 'duid5', 'duid7', 'duid10', 'duid12', 'duid15',
+                    'tdma_duid3', 'tdma_duid5', 'set_hold', 'unset_hold', 'skip', 'lockout', 'logging_scheduler']
+RX_PROFILE_INDEX = dict([(name, i) for i, name in enumerate(RX_PROFILE_NAMES)])
+PROFILE_LOGGING_SCHEDULER = RX_PROFILE_INDEX['logging_scheduler']
+
+# grant to retune latency, by stage: queue (frame assembly, stamped in
+# message arg1, to the start of process_qmsgs), decode (the rest of the
+# batch), schedule (up to the frequency_set call or worker retune) and
+# tune (frequency_set / worker retune until it returns).  The grant is
+# the first message in the batch that updated a talkgroup
+LATENCY_BINS = 24	# up to 8 seconds
+LATENCY_QUEUE = 0
+LATENCY_DECODE = 1
+LATENCY_SCHEDULE = 2
+LATENCY_TUNE = 3
+LATENCY_TOTAL = 4
+LATENCY_NAMES = ['queue', 'decode', 'schedule', 'tune', 'grant to tune']
+
+grant_stamp = collections.namedtuple('grant_stamp', 'queued dequeued decoded')
+
+class latency_tracker(object):
+    def __init__(self, logfile=None):
+        self.profile = decode_profile(LATENCY_NAMES, bins=LATENCY_BINS)
+        self.log = None
+        if logfile:
+            self.log = open(logfile, 'a')
+            self.log.seek(0, 2)
+            if self.log.tell() == 0:
+                self.log.write('# time tgid frequency queue_ms decode_ms schedule_ms tune_ms total_ms\n')
+
+    def add(self, stamp, t_request, t_tuned, tgid, frequency):
+        stages = (stamp.dequeued - stamp.queued, stamp.decoded - stamp.dequeued, t_request - stamp.decoded, t_tuned - t_request, t_tuned - stamp.queued)
+        for key in xrange(len(stages)):
+            self.profile.add(key, stages[key])
+        if self.log:
+            self.log.write('%f %s %d %s\n' % (t_tuned, tgid, frequency, ' '.join(['%.3f' % (dt * 1e3) for dt in stages])))
+            self.log.flush()
+
+    def snapshot(self):
+        return self.profile.snapshot()
+
+    def close(self):
+        if self.log:
+            self.log.close()
+            self.log = None
+
+# table records.  __slots__ keeps the per-entry size down on long runs
+class talkgroup(object):
+    __slots__ = ('counter', 'time', 'frequency', 'tdma_slot')
+    def __init__(self):
+        self.counter = 0
+        self.time = 0
+        self.frequency = None
+        self.tdma_slot = None
+
+class voice_frequency(object):
+    __slots__ = ('counter', 'time', 'tgid')
+    def __init__(self):
+        self.counter = 0
+        self.time = 0
+        self.tgid = [None, None]	# per tdma slot
+
+class working_frequency(object):
+    __slots__ = ('tgids', 'worker')
+    def __init__(self, worker):
+        self.tgids = {}	# tgid -> working_tgid
+        self.worker = worker
+
+class working_tgid(object):
+    __slots__ = ('updated', 'tdma_slot')
+    def __init__(self, updated, tdma_slot):
+        self.updated = updated
+        self.tdma_slot = tdma_slot
+
 class trunked_system (object):
-    def __init__(self, debug=0, config=None):
+    def __init__(self, debug=0, config=None, clock=time.time):
         self.debug = debug
+        self.clock = clock
         self.freq_table = {}
+        self.chan_table = [None] * 0x10000
         self.stats = {}
         self.stats['tsbks'] = 0
         self.stats['crc'] = 0
+        self.stats['cache_hits'] = 0
+        self.stats['cache_misses'] = 0
+        self.msg_counts = [0] * 0x8000	# tsbk by (opcode << 8) | mfrid, mbt at 0x4000 + same
+        self.profile = decode_profile(self.profile_names)
         self.tsbk_cache = {}
-        self.secondary = {}
+        self.TSBK_CACHE_TIME = 0.5	# must stay well below rx_ctl.TGID_HOLD_TIME
+        self.last_cache_purge = 0
+        self.grant_log = None
+        self.secondary = sorted_dict()
         self.adjacent = {}
         self.rfss_syid = 0
         self.rfss_rfid = 0
@@ -78,8 +424,11 @@ class trunked_system (object):
         self.ns_syid = -1
         self.ns_wacn = -1
         self.ns_chan = 0
-        self.voice_frequencies = {}
-        self.blacklist = {}
+        self.voice_frequencies = sorted_dict()
+        self.blacklist = tgid_filter()	# permanent lockouts
+        self.blacklist_shared = False	# loaded from config, copy before adding to it
+        self.skiplist = {}	# tgid -> end of skip
+        self.skip_heap = []	# (end, tgid), may hold entries superseded in skiplist
         self.whitelist = None
         self.tgid_map = {}
         self.offset = 0
@@ -96,8 +445,13 @@ class trunked_system (object):
         self.secure_list = [] #track encrypted talkgroups
 
         self.talkgroups = {}
+        self.tg_activity = collections.deque()	# (time, tgid) in update order
+        self.warm_idens = set()	# freq_table entries loaded by load_state, not yet rebroadcast
+        self.warm_ns = None	# (syid, wacn) loaded by load_state, until a net status arrives
         if config:
-            self.blacklist = config['blacklist']
+            if config['blacklist'] is not None:
+                self.blacklist = config['blacklist']
+                self.blacklist_shared = True
             self.whitelist = config['whitelist']
             self.tgid_map  = config['tgid_map']
             self.offset    = config['offset']
@@ -112,12 +466,12 @@ class trunked_system (object):
         s.append('rf: syid %x rfid %d stid %d frequency %f uplink %f' % ( self.rfss_syid, self.rfss_rfid, self.rfss_stid, float(self.rfss_chan) / 1000000.0, float(self.rfss_txchan) / 1000000.0))
         s.append('net: syid %x wacn %x frequency %f' % ( self.ns_syid, self.ns_wacn, float(self.ns_chan) / 1000000.0))
         s.append('secondary control channel(s): %s' % ','.join(['%f' % (float(k) / 1000000.0) for k in self.secondary.keys()]))
-        s.append('stats: tsbks %d crc %d' % (self.stats['tsbks'], self.stats['crc']))
+        s.append('stats: tsbks %d crc %d grant cache hits %d misses %d' % (self.stats['tsbks'], self.stats['crc'], self.stats['cache_hits'], self.stats['cache_misses']))
         s.append('')
-        t = time.time()
+        t = self.clock()
         for f in self.voice_frequencies:
-            tgs = '%s %s' % (self.voice_frequencies[f]['tgid'][0], self.voice_frequencies[f]['tgid'][1])
-            s.append('voice frequency %f tgid(s) %s %4.1fs ago count %d' %  (f / 1000000.0, tgs, t - self.voice_frequencies[f]['time'], self.voice_frequencies[f]['counter']))
+            tgs = '%s %s' % (self.voice_frequencies[f].tgid[0], self.voice_frequencies[f].tgid[1])
+            s.append('voice frequency %f tgid(s) %s %4.1fs ago count %d' %  (f / 1000000.0, tgs, t - self.voice_frequencies[f].time, self.voice_frequencies[f].counter))
         s.append('')
         for table in self.freq_table:
             a = self.freq_table[table]['frequency'] / 1000000.0
@@ -129,24 +483,45 @@ class trunked_system (object):
             s.append('adjacent %f: %s' % (float(f) / 1000000.0, self.adjacent[f]))
         return '\n'.join(s)
 
-    def get_tdma_slot(self, id):
-        table = (id >> 12) & 0xf
-        channel = id & 0xfff
+    # channel ids are resolved through chan_table, a flat list holding a
+    # (frequency, tdma slot) pair for each of the 65536 ids.  Each 4096-id
+    # block is built on first use from its freq_table entry and cleared
+    # only when an IDEN_UP changes that entry
+    def channel_lookup(self, id):
+        entry = self.chan_table[id]
+        if entry is None:
+            self.build_chan_table(id >> 12)
+            entry = self.chan_table[id]
+        return entry
+
+    def build_chan_table(self, table):
+        base = table << 12
         if table not in self.freq_table:
-            return None
+            self.chan_table[base:base+0x1000] = [NO_CHANNEL] * 0x1000
+            return
+        frequency = self.freq_table[table]['frequency']
+        step = self.freq_table[table]['step']
         if 'tdma' not in self.freq_table[table]:
-            return None
-        return channel & 1
+            self.chan_table[base:base+0x1000] = [(frequency + step * channel, None) for channel in xrange(0x1000)]
+        else:
+            tdma = self.freq_table[table]['tdma']
+            self.chan_table[base:base+0x1000] = [(frequency + step * int(channel / tdma), channel & 1) for channel in xrange(0x1000)]
+
+    def update_freq_table(self, iden, entry):
+        if self.warm_idens:
+            self.warm_idens.discard(iden)
+        if self.freq_table.get(iden) == entry:
+            return	# periodic rebroadcast, nothing changed
+        self.freq_table[iden] = entry
+        self.chan_table[iden<<12:(iden+1)<<12] = UNBUILT_CHANNELS
+        self.tsbk_cache = {}	# cached grants may refer to the old table
+
+    def get_tdma_slot(self, id):
+        return self.channel_lookup(id)[1]
 
 # return frequency in Hz
     def channel_id_to_frequency(self, id):
-        table = (id >> 12) & 0xf
-        channel = id & 0xfff
-        if table not in self.freq_table:
-            return None
-        if 'tdma' not in self.freq_table[table]:
-            return self.freq_table[table]['frequency'] + self.freq_table[table]['step'] * channel
-        return self.freq_table[table]['frequency'] + self.freq_table[table]['step'] * int(channel / self.freq_table[table]['tdma'])
+        return self.channel_lookup(id)[0]
 
     def channel_id_to_string(self, id):
         f = self.channel_id_to_frequency(id)
@@ -163,339 +538,479 @@ class trunked_system (object):
 
     def update_talkgroup(self, frequency, tgid, tdma_slot):
         if tgid not in self.talkgroups:
-            self.talkgroups[tgid] = {'counter':0}
-        self.talkgroups[tgid]['time'] = time.time()
-        self.talkgroups[tgid]['frequency'] = frequency
-        self.talkgroups[tgid]['tdma_slot'] = tdma_slot
+            self.talkgroups[tgid] = talkgroup()
+        self.touch_talkgroup(tgid, self.clock())
+        self.talkgroups[tgid].frequency = frequency
+        self.talkgroups[tgid].tdma_slot = tdma_slot
 
     def update_voice_frequency(self, frequency, tgid=None, tdma_slot=None):
         if not frequency:	# e.g., channel identifier not yet known
             return
         self.update_talkgroup(frequency, tgid, tdma_slot)
         if frequency not in self.voice_frequencies:
-            self.voice_frequencies[frequency] = {'counter':0}
-            sorted_freqs = collections.OrderedDict(sorted(self.voice_frequencies.items()))
-            self.voice_frequencies = sorted_freqs
+            self.voice_frequencies[frequency] = voice_frequency()
         if tdma_slot is None:
             tdma_slot = 0
-        if 'tgid' not in self.voice_frequencies[frequency]:
-            self.voice_frequencies[frequency]['tgid'] = [None, None]
-        self.voice_frequencies[frequency]['tgid'][tdma_slot] = tgid
-        self.voice_frequencies[frequency]['counter'] += 1
-        self.voice_frequencies[frequency]['time'] = time.time()
+        self.voice_frequencies[frequency].tgid[tdma_slot] = tgid
+        self.voice_frequencies[frequency].counter += 1
+        self.voice_frequencies[frequency].time = self.clock()
+        if self.grant_log is not None:
+            self.grant_log.append((frequency, tgid))
+
+    # every update appends to tg_activity, so the talkgroups updated since
+    # a given time are found by walking back from the newest entry.
+    # Superseded entries are dropped once they outnumber the live ones
+    def touch_talkgroup(self, tgid, curr_time):
+        self.talkgroups[tgid].time = curr_time
+        self.tg_activity.append((curr_time, tgid))
+        if len(self.tg_activity) > 2 * len(self.talkgroups) + 256:
+            self.tg_activity = collections.deque([e for e in self.tg_activity if self.talkgroups[e[1]].time == e[0]])
+
+    def updated_since(self, start_time):	# oldest update first
+        tgids = []
+        seen = set()
+        for t, tgid in reversed(self.tg_activity):
+            if t < start_time:
+                break
+            if tgid not in seen:
+                seen.add(tgid)
+                tgids.append(tgid)
+        tgids.reverse()
+        return tgids
 
     def get_updated_talkgroups(self, start_time):
-        return [tgid for tgid in self.talkgroups if (
-                       self.talkgroups[tgid]['time'] >= start_time and
+        self.blacklist_update(start_time)
+        return [tgid for tgid in self.updated_since(start_time) if (
                        tgid not in self.blacklist and
+                       tgid not in self.skiplist and
                        not (self.whitelist and tgid not in self.whitelist))]
 
-    def blacklist_update(self, start_time):
-        expired_tgs = [tg for tg in self.blacklist.keys()
-                            if self.blacklist[tg] is not None
-                            and self.blacklist[tg] < start_time]
-        for tg in expired_tgs:
-            self.blacklist.pop(tg)
+    def blacklist_update(self, start_time):	# expire skips
+        while self.skip_heap and self.skip_heap[0][0] < start_time:
+            end_time, tgid = heapq.heappop(self.skip_heap)
+            if self.skiplist.get(tgid) == end_time:
+                del self.skiplist[tgid]
 
+    # tgid (the held talkgroup) if it is active, else the first eligible
+    # talkgroup updated since start_time, taken in order of their latest
+    # update: the one quiet the longest first.  Before the activity index
+    # the candidates were tried in talkgroups dict order, i.e. arbitrarily
     def find_talkgroup(self, start_time, tgid=None):
         self.blacklist_update(start_time)
-        if tgid is not None and tgid in self.talkgroups and self.talkgroups[tgid]['time'] >= start_time:
-            return self.talkgroups[tgid]['frequency'], tgid, self.talkgroups[tgid]['tdma_slot']
-        for active_tgid in self.talkgroups:
-            if self.talkgroups[active_tgid]['time'] < start_time:
-                continue
-            if active_tgid in self.blacklist:
+        if tgid is not None and tgid in self.talkgroups and self.talkgroups[tgid].time >= start_time:
+            return self.talkgroups[tgid].frequency, tgid, self.talkgroups[tgid].tdma_slot
+        for active_tgid in self.updated_since(start_time):
+            if active_tgid in self.blacklist or active_tgid in self.skiplist:
                 continue
             if self.whitelist and active_tgid not in self.whitelist:
                 continue
-            if self.talkgroups[active_tgid]['tdma_slot'] is not None and (self.ns_syid < 0 or self.ns_wacn < 0):
+            if self.talkgroups[active_tgid].tdma_slot is not None and (self.ns_syid < 0 or self.ns_wacn < 0):
                 continue
             if tgid is None:
-                return self.talkgroups[active_tgid]['frequency'], active_tgid, self.talkgroups[active_tgid]['tdma_slot']
+                return self.talkgroups[active_tgid].frequency, active_tgid, self.talkgroups[active_tgid].tdma_slot
         return None, None, None
 
     def add_blacklist(self, tgid, end_time=None):
         if not tgid:
             return
-        self.blacklist[tgid] = end_time
+        if end_time is None:
+            if self.blacklist_shared:
+                self.blacklist = self.blacklist.copy()
+                self.blacklist_shared = False
+            self.blacklist.add(tgid)
+            self.skiplist.pop(tgid, None)
+            return
+        self.skiplist[tgid] = end_time
+        heapq.heappush(self.skip_heap, (end_time, tgid))
+
+    def add_secure(self, tgid):
+        if tgid in self.secure_list:
+            return
+        self.secure_list.append(tgid)
+        # grant updates are not followed for an encrypted talkgroup, drop
+        # the cached ones that would still refresh it on a hit
+        self.tsbk_cache = dict([(k, v) for k, v in self.tsbk_cache.iteritems() if tgid not in [t for f, t in v[1]]])
 
     def decode_mbt_data(self, opcode, header, mbt_data):
+        t0 = time.time()
         self.cc_timeouts = 0
-        self.last_tsbk = time.time()
+        self.last_tsbk = self.clock()
         if self.debug > 10:
             print "decode_mbt_data: %x %x" %(opcode, mbt_data)
-        if opcode == 0x0:  # grp voice channel grant
-            opts  = (header >> 24) & 0xff
-            (PRI,E,P,D,M) = get_srv_options(opts)
-            ch1  = (mbt_data >> 64) & 0xffff
-            ch2  = (mbt_data >> 48) & 0xffff
-            ga   = (mbt_data >> 32) & 0xffff
-            if self.debug > 10:
-                print "mbt00 voice grant ch1 %x ch2 %x addr 0x%x" %(ch1, ch2, ga)
-        elif opcode == 0x3c:  # adjacent status
-            syid = (header >> 48) & 0xfff
-            rfid = (header >> 24) & 0xff
-            stid = (header >> 16) & 0xff
-            ch1  = (mbt_data >> 80) & 0xffff
-            ch2  = (mbt_data >> 64) & 0xffff
-            f1 = self.channel_id_to_frequency(ch1)
-            f2 = self.channel_id_to_frequency(ch2)
-            if f1 and f2:
-                self.adjacent[f1] = 'rfid: %d stid:%d uplink:%f' % (rfid, stid, f2 / 1000000.0)
-            if self.debug > 10:
-                print "mbt3c adjacent sys %x rfid %x stid %x ch1 %x ch2 %x f1 %s f2 %s" %(syid, rfid, stid, ch1, ch2, self.channel_id_to_string(ch1), self.channel_id_to_string(ch2))
-        elif opcode == 0x3b:  # network status
-            syid = (header >> 48) & 0xfff
-            wacn = (mbt_data >> 76) & 0xfffff
-            ch1  = (mbt_data >> 56) & 0xffff
-            ch2  = (mbt_data >> 40) & 0xffff
-            f1 = self.channel_id_to_frequency(ch1)
-            f2 = self.channel_id_to_frequency(ch2)
-            if f1 and f2:
-                self.ns_syid = syid
-                self.ns_wacn = wacn
-                self.ns_chan = f1
-            if self.debug > 10:
-                print "mbt3b net stat sys %x wacn %x ch1 %s ch2 %s" %(syid, wacn, self.channel_id_to_string(ch1), self.channel_id_to_string(ch2))
-        elif opcode == 0x3a:  # rfss status
-            syid = (header >> 48) & 0xfff
-            rfid = (mbt_data >> 88) & 0xff
-            stid = (mbt_data >> 80) & 0xff
-            ch1  = (mbt_data >> 64) & 0xffff
-            ch2  = (mbt_data >> 48) & 0xffff
-            f1 = self.channel_id_to_frequency(ch1)
-            f2 = self.channel_id_to_frequency(ch2)
-            if f1 and f2:
-                self.rfss_syid = syid
-                self.rfss_rfid = rfid
-                self.rfss_stid = stid
-                self.rfss_chan = f1
-                self.rfss_txchan = f2
-            if self.debug > 10:
-                print "mbt3a rfss stat sys %x rfid %x stid %x ch1 %s ch2 %s" %(syid, rfid, stid, self.channel_id_to_string(ch1), self.channel_id_to_string(ch2))
+        key = (opcode << 8) | ((header >> 72) & 0xff)
+        self.msg_counts[0x4000 | key] += 1
+        handler = self.mbt_dispatch[key]
+        if handler is not None:
+            handler(self, header, mbt_data)
+        self.profile.add(self.mbt_profile_index[key], time.time() - t0)
         #else:
         #    print "mbt other %x" % opcode
 
-    def decode_tsbk(self, tsbk):
+    def mbt_grp_v_ch_grant(self, header, mbt_data):
+        if self.debug > 10:
+            opts, = MBT_HDR_SRV_OPTIONS(header)
+            (PRI,E,P,D,M) = get_srv_options(opts)
+            ch1, ch2, ga = MBT_GRP_V_CH_GRANT(mbt_data)
+            print "mbt00 voice grant ch1 %x ch2 %x addr 0x%x" %(ch1, ch2, ga)
+
+    def mbt_adj_sts_bcst(self, header, mbt_data):
+        syid, rfid, stid = MBT_HDR_ADJ_STS(header)
+        ch1, ch2 = MBT_ADJ_STS_BCST(mbt_data)
+        f1 = self.channel_id_to_frequency(ch1)
+        f2 = self.channel_id_to_frequency(ch2)
+        if f1 and f2:
+            self.adjacent[f1] = 'rfid: %d stid:%d uplink:%f' % (rfid, stid, f2 / 1000000.0)
+        if self.debug > 10:
+            print "mbt3c adjacent sys %x rfid %x stid %x ch1 %x ch2 %x f1 %s f2 %s" %(syid, rfid, stid, ch1, ch2, self.channel_id_to_string(ch1), self.channel_id_to_string(ch2))
+
+    def mbt_net_sts_bcst(self, header, mbt_data):
+        syid, = MBT_HDR_SYID(header)
+        wacn, ch1, ch2 = MBT_NET_STS_BCST(mbt_data)
+        if self.warm_ns is not None:
+            self.check_warm_state(syid, wacn)
+        f1 = self.channel_id_to_frequency(ch1)
+        f2 = self.channel_id_to_frequency(ch2)
+        if f1 and f2:
+            self.ns_syid = syid
+            self.ns_wacn = wacn
+            self.ns_chan = f1
+        if self.debug > 10:
+            print "mbt3b net stat sys %x wacn %x ch1 %s ch2 %s" %(syid, wacn, self.channel_id_to_string(ch1), self.channel_id_to_string(ch2))
+
+    def mbt_rfss_sts_bcst(self, header, mbt_data):
+        syid, = MBT_HDR_SYID(header)
+        rfid, stid, ch1, ch2 = MBT_RFSS_STS_BCST(mbt_data)
+        f1 = self.channel_id_to_frequency(ch1)
+        f2 = self.channel_id_to_frequency(ch2)
+        if f1 and f2:
+            self.rfss_syid = syid
+            self.rfss_rfid = rfid
+            self.rfss_stid = stid
+            self.rfss_chan = f1
+            self.rfss_txchan = f2
+        if self.debug > 10:
+            print "mbt3a rfss stat sys %x rfid %x stid %x ch1 %s ch2 %s" %(syid, rfid, stid, self.channel_id_to_string(ch1), self.channel_id_to_string(ch2))
+
+    mbt_dispatch = mk_dispatch([
+        ((0x00, None), mbt_grp_v_ch_grant),
+        ((0x3a, None), mbt_rfss_sts_bcst),
+        ((0x3b, None), mbt_net_sts_bcst),
+        ((0x3c, None), mbt_adj_sts_bcst)])
+
+    def decode_tsbk(self, tsbk, crc=None):	# crc: crc16_tsbk(tsbk) if known
+        t0 = time.time()
         self.cc_timeouts = 0
         self.stats['tsbks'] += 1
+        key = (tsbk >> 80) & 0x3fff	# opcode and mfrid
+        if self.debug > 10:
+            print "TSBK: 0x%02x 0x%024x" % (key >> 8, tsbk)
+        opcode = key >> 8
+        if opcode == 0x02 or opcode == 0x03:
+            return self.decode_grant_update(key, tsbk, crc, t0)
+        if not tsbk_crc_ok(tsbk, crc):
+            self.stats['crc'] += 1
+            self.profile.add(PROFILE_CRC, time.time() - t0)
+            return 0	# crc check failed
+        self.msg_counts[key] += 1
+        handler = self.tsbk_dispatch[key]
         updated = 0
-        #if crc16(tsbk, 12) != 0:
-        #    self.stats['crc'] += 1
-        #    return	# crc check failed
-        #tsbk = tsbk << 16	# for missing crc
-        opcode = (tsbk >> 88) & 0x3f
+        if handler is not None:
+            updated = handler(self, tsbk)
+        #else:
+        #    print "tsbk other %x" % (key >> 8)
+        self.profile.add(self.tsbk_profile_index[key], time.time() - t0)
+        return updated
+
+    # grant updates are rebroadcast many times per second.  A copy seen
+    # again within TSBK_CACHE_TIME of the first one only refreshes the
+    # timestamps and returns -1: the caller skips the worker scheduler,
+    # and counts it as one 'update' per batch (a call in progress is still
+    # picked up on the return to the control channel).
+    # Entries are not extended on a hit, so every TSBK_CACHE_TIME a copy
+    # goes through the full decode and keeps the call alive downstream
+    def decode_grant_update(self, key, tsbk, crc, t0):
+        curr_time = self.clock()
+        entry = self.tsbk_cache.get(tsbk)
+        if entry is not None and entry[0] > curr_time:
+            self.stats['cache_hits'] += 1
+            self.msg_counts[key] += 1
+            for frequency, tgid in entry[1]:
+                self.talkgroups[tgid].time = curr_time	# as touch_talkgroup()
+                self.tg_activity.append((curr_time, tgid))
+                self.voice_frequencies[frequency].time = curr_time
+            self.profile.add(PROFILE_CACHE_HIT, time.time() - t0)
+            return -1
+        if not tsbk_crc_ok(tsbk, crc):	# hits are copies of a tsbk that passed
+            self.stats['crc'] += 1
+            self.profile.add(PROFILE_CRC, time.time() - t0)
+            return 0
+        self.stats['cache_misses'] += 1
+        self.msg_counts[key] += 1
+        self.grant_log = []
+        updated = self.tsbk_dispatch[key](self, tsbk)
+        self.tsbk_cache[tsbk] = (curr_time + self.TSBK_CACHE_TIME, self.grant_log)
+        self.grant_log = None
+        if curr_time > self.last_cache_purge + 1.0:
+            self.last_cache_purge = curr_time
+            self.tsbk_cache = dict([(k, v) for k, v in self.tsbk_cache.iteritems() if v[0] > curr_time])
+        self.profile.add(self.tsbk_profile_index[key], time.time() - t0)
+        return updated
+
+    def tsbk_grp_v_ch_grant(self, tsbk):	# group voice chan grant
+        updated = 0
+        opts, ch, ga, sa = TSBK_GRP_V_CH_GRANT(tsbk)
+        (PRI,E,P,D,M) = get_srv_options(opts)
+        f, slot = self.channel_lookup(ch)
+        self.update_voice_frequency(f, tgid=ga, tdma_slot=slot)
+        if f and P == 0:
+            updated += 1
+        if P == 1:
+            self.add_secure(ga)
         if self.debug > 10:
-            print "TSBK: 0x%02x 0x%024x" % (opcode, tsbk)
-        if opcode == 0x00:   # group voice chan grant
-            mfrid  = (tsbk >> 80) & 0xff
-            if mfrid == 0x90:	# MOT_GRG_ADD_CMD
-                sg  = (tsbk >> 64) & 0xffff
-                ga1   = (tsbk >> 48) & 0xffff
-                ga2   = (tsbk >> 32) & 0xffff
-                ga3   = (tsbk >> 16) & 0xffff
-                if self.debug > 10:
-                    print "MOT_GRG_ADD_CMD(0x00): sg:%d ga1:%d ga2:%d ga3:%d" % (sg, ga1, ga2, ga3)
-            else:
-                opts  = (tsbk >> 72) & 0xff
-                (PRI,E,P,D,M) = get_srv_options(opts)
-                ch   = (tsbk >> 56) & 0xffff
-                ga   = (tsbk >> 40) & 0xffff
-                sa   = (tsbk >> 16) & 0xffffff
-                f = self.channel_id_to_frequency(ch)
-                self.update_voice_frequency(f, tgid=ga, tdma_slot=self.get_tdma_slot(ch))
-                if f and P == 0:
-                    updated += 1
-                if P == 1 and ga not in self.secure_list:
-                    self.secure_list.append(ga)
-                if self.debug > 10:
-                    print "tsbk00 grant freq %s ga %d sa %d" % (self.channel_id_to_string(ch), ga, sa)
-        elif opcode == 0x01:   # reserved
-            mfrid  = (tsbk >> 80) & 0xff
-            if mfrid == 0x90: #MOT_GRG_DEL_CMD
-                sg  = (tsbk >> 64) & 0xffff
-                ga1   = (tsbk >> 48) & 0xffff
-                ga2   = (tsbk >> 32) & 0xffff
-                ga3   = (tsbk >> 16) & 0xffff
-                if self.debug > 10:
-                    print "MOT_GRG_DEL_CMD(0x01): sg:%d ga1:%d ga2:%d ga3:%d" % (sg, ga1, ga2, ga3)
-        elif opcode == 0x02:   # group voice chan grant update
-            mfrid  = (tsbk >> 80) & 0xff
-            if mfrid == 0x90:
-                ch  = (tsbk >> 56) & 0xffff
-                sg  = (tsbk >> 40) & 0xffff
-                sa  = (tsbk >> 16) & 0xffffff
-                f = self.channel_id_to_frequency(ch)
-                self.update_voice_frequency(f, tgid=sg, tdma_slot=self.get_tdma_slot(ch))
-                if f:
-                    updated += 1
-                if self.debug > 10:
-                    print "MOT_GRG_CN_GRANT(0x02): freq %s sg:%d sa:%d" % (self.channel_id_to_string(ch), sg, sa)
-            else:
-                ch1  = (tsbk >> 64) & 0xffff
-                ga1  = (tsbk >> 48) & 0xffff
-                ch2  = (tsbk >> 32) & 0xffff
-                ga2  = (tsbk >> 16) & 0xffff
-                f1 = self.channel_id_to_frequency(ch1)
-                f2 = self.channel_id_to_frequency(ch2)
-                if ga1 not in self.secure_list and ga2 not in self.secure_list: #skip late entry for enc enabled tgs
-                    self.update_voice_frequency(f1, tgid=ga1, tdma_slot=self.get_tdma_slot(ch1))
-                    if f1 != f2:
-                        self.update_voice_frequency(f2, tgid=ga2, tdma_slot=self.get_tdma_slot(ch2))
-                    if f1:
-                        updated += 1
-                    if f2:
-                        updated += 1
-                if self.debug > 10:
-                    print "tsbk02 grant update: chan %s %d %s %d" %(self.channel_id_to_string(ch1), ga1, self.channel_id_to_string(ch2), ga2)
-        elif opcode == 0x03:   # group voice chan grant update exp : TIA.102-AABC-B-2005 page 56
-            mfrid  = (tsbk >> 80) & 0xff
-            if mfrid == 0x90: #MOT_GRG_CN_GRANT_UPDT
-                ch1   = (tsbk >> 64) & 0xffff
-                sg1  = (tsbk >> 48) & 0xffff
-                ch2   = (tsbk >> 32) & 0xffff
-                sg2  = (tsbk >> 16) & 0xffff
-                f1 = self.channel_id_to_frequency(ch1)
-                f2 = self.channel_id_to_frequency(ch2)
-                self.update_voice_frequency(f1, tgid=sg1, tdma_slot=self.get_tdma_slot(ch1))
-                if f1 != f2:
-                    self.update_voice_frequency(f2, tgid=sg2, tdma_slot=self.get_tdma_slot(ch2))
-                if f1:
-                    updated += 1
-                if f2:
-                    updated += 1
-                if self.debug > 10:
-                    print "MOT_GRG_CN_GRANT_UPDT(0x03): freq %s sg1:%d freq %s sg2:%d" % (self.channel_id_to_string(ch1), sg1, self.channel_id_to_string(ch2), sg2)
-            else:
-                opts = (tsbk >> 72) & 0xff # Service Options: TIA-102.AABC-C page 35
-                (PRI,E,P,D,M) = get_srv_options(opts)
-
-                ch1  = (tsbk >> 48) & 0xffff
-                ch2 = (tsbk >> 32) & 0xffff
-                ga  = (tsbk >> 16) & 0xffff
-                f1 = self.channel_id_to_frequency(ch1)
-                if f1 == None: f1 = 0
-                self.update_voice_frequency(f1, tgid=ga, tdma_slot=self.get_tdma_slot(ch1))
-                if f1 and P == 0:
-                    updated += 1
-                if P == 1 and ga not in self.secure_list:
-                    self.secure_list.append(ga)
-                if self.debug > 10:
-                    print "tsbk03 grant update exp: ch %d freq %f ga %d" % (self.channel_id_to_string(ch1), f1 / 1000000.0, ga)
-        elif opcode == 0x16:   # sndcp data ch
-            ch1  = (tsbk >> 48) & 0xffff
-            ch2  = (tsbk >> 32) & 0xffff
-            if self.debug > 10:
-                print "tsbk16 sndcp data ch: chan %x %x" %(ch1, ch2)
-        elif opcode == 0x34:   # iden_up vhf uhf
-            iden = (tsbk >> 76) & 0xf
-            bwvu = (tsbk >> 72) & 0xf
-            toff0 = (tsbk >> 58) & 0x3fff
-            spac = (tsbk >> 48) & 0x3ff
-            freq = (tsbk >> 16) & 0xffffffff
-            toff_sign = (toff0 >> 13) & 1
-            toff = toff0 & 0x1fff
-            if toff_sign == 0:
-                toff = 0 - toff
-            txt = ["mob Tx-", "mob Tx+"]
-            self.freq_table[iden] = {}
-            self.freq_table[iden]['offset'] = toff * spac * 125
-            self.freq_table[iden]['step'] = spac * 125
-            self.freq_table[iden]['frequency'] = freq * 5
-            if self.debug > 10:
-                print "tsbk34 iden vhf/uhf id %d toff %f spac %f freq %f [%s]" % (iden, toff * spac * 0.125 * 1e-3, spac * 0.125, freq * 0.000005, txt[toff_sign])
-        elif opcode == 0x33:   # iden_up_tdma
-            mfrid  = (tsbk >> 80) & 0xff
-            if mfrid == 0:
-                iden = (tsbk >> 76) & 0xf
-                channel_type = (tsbk >> 72) & 0xf
-                toff0 = (tsbk >> 58) & 0x3fff
-                spac = (tsbk >> 48) & 0x3ff
-                toff_sign = (toff0 >> 13) & 1
-                toff = toff0 & 0x1fff
-                if toff_sign == 0:
-                    toff = 0 - toff
-                f1   = (tsbk >> 16) & 0xffffffff
-                slots_per_carrier = [1,1,1,2,4,2]
-                self.freq_table[iden] = {}
-                self.freq_table[iden]['offset'] = toff * spac * 125
-                self.freq_table[iden]['step'] = spac * 125
-                self.freq_table[iden]['frequency'] = f1 * 5
-                self.freq_table[iden]['tdma'] = slots_per_carrier[channel_type]
-                if self.debug > 10:
-                    print "tsbk33 iden up tdma id %d f %d offset %d spacing %d slots/carrier %d" % (iden, self.freq_table[iden]['frequency'], self.freq_table[iden]['offset'], self.freq_table[iden]['step'], self.freq_table[iden]['tdma'])
-
-        elif opcode == 0x3d:   # iden_up
-            iden = (tsbk >> 76) & 0xf
-            bw   = (tsbk >> 67) & 0x1ff
-            toff0 = (tsbk >> 58) & 0x1ff
-            spac = (tsbk >> 48) & 0x3ff
-            freq = (tsbk >> 16) & 0xffffffff
-            toff_sign = (toff0 >> 8) & 1
-            toff = toff0 & 0xff
-            if toff_sign == 0:
-                toff = 0 - toff
-            txt = ["mob xmit < recv", "mob xmit > recv"]
-            self.freq_table[iden] = {}
-            self.freq_table[iden]['offset'] = toff * 250000
-            self.freq_table[iden]['step'] = spac * 125
-            self.freq_table[iden]['frequency'] = freq * 5
-            if self.debug > 10:
-                print "tsbk3d iden id %d toff %f spac %f freq %f" % (iden, toff * 0.25, spac * 0.125, freq * 0.000005)
-        elif opcode == 0x3a:   # rfss status
-            syid = (tsbk >> 56) & 0xfff
-            rfid = (tsbk >> 48) & 0xff
-            stid = (tsbk >> 40) & 0xff
-            chan = (tsbk >> 24) & 0xffff
-            f1 = self.channel_id_to_frequency(chan)
+            print "tsbk00 grant freq %s ga %d sa %d" % (self.channel_id_to_string(ch), ga, sa)
+        return updated
+
+    def tsbk_mot_grg_add_cmd(self, tsbk):
+        if self.debug > 10:
+            sg, ga1, ga2, ga3 = TSBK_MOT_GRG_CMD(tsbk)
+            print "MOT_GRG_ADD_CMD(0x00): sg:%d ga1:%d ga2:%d ga3:%d" % (sg, ga1, ga2, ga3)
+        return 0
+
+    def tsbk_mot_grg_del_cmd(self, tsbk):
+        if self.debug > 10:
+            sg, ga1, ga2, ga3 = TSBK_MOT_GRG_CMD(tsbk)
+            print "MOT_GRG_DEL_CMD(0x01): sg:%d ga1:%d ga2:%d ga3:%d" % (sg, ga1, ga2, ga3)
+        return 0
+
+    def tsbk_mot_grg_cn_grant(self, tsbk):
+        updated = 0
+        ch, sg, sa = TSBK_MOT_GRG_CN_GRANT(tsbk)
+        f, slot = self.channel_lookup(ch)
+        self.update_voice_frequency(f, tgid=sg, tdma_slot=slot)
+        if f:
+            updated += 1
+        if self.debug > 10:
+            print "MOT_GRG_CN_GRANT(0x02): freq %s sg:%d sa:%d" % (self.channel_id_to_string(ch), sg, sa)
+        return updated
+
+    def tsbk_grp_v_ch_grant_updt(self, tsbk):	# group voice chan grant update
+        updated = 0
+        ch1, ga1, ch2, ga2 = TSBK_GRP_V_CH_GRANT_UPDT(tsbk)
+        f1, slot1 = self.channel_lookup(ch1)
+        f2, slot2 = self.channel_lookup(ch2)
+        if ga1 not in self.secure_list and ga2 not in self.secure_list: #skip late entry for enc enabled tgs
+            self.update_voice_frequency(f1, tgid=ga1, tdma_slot=slot1)
+            if f1 != f2:
+                self.update_voice_frequency(f2, tgid=ga2, tdma_slot=slot2)
             if f1:
-                self.rfss_syid = syid
-                self.rfss_rfid = rfid
-                self.rfss_stid = stid
-                self.rfss_chan = f1
-                self.rfss_txchan = f1 + self.freq_table[chan >> 12]['offset']
-            if self.debug > 10:
-                print "tsbk3a rfss status: syid: %x rfid %x stid %d ch1 %x(%s)" %(syid, rfid, stid, chan, self.channel_id_to_string(chan))
-        elif opcode == 0x39:   # secondary cc
-            rfid = (tsbk >> 72) & 0xff
-            stid = (tsbk >> 64) & 0xff
-            ch1  = (tsbk >> 48) & 0xffff
-            ch2  = (tsbk >> 24) & 0xffff
-            f1 = self.channel_id_to_frequency(ch1)
-            f2 = self.channel_id_to_frequency(ch2)
-            if f1 and f2:
+                updated += 1
+            if f2:
+                updated += 1
+        if self.debug > 10:
+            print "tsbk02 grant update: chan %s %d %s %d" %(self.channel_id_to_string(ch1), ga1, self.channel_id_to_string(ch2), ga2)
+        return updated
+
+    def tsbk_mot_grg_cn_grant_updt(self, tsbk):
+        updated = 0
+        ch1, sg1, ch2, sg2 = TSBK_GRP_V_CH_GRANT_UPDT(tsbk)
+        f1, slot1 = self.channel_lookup(ch1)
+        f2, slot2 = self.channel_lookup(ch2)
+        self.update_voice_frequency(f1, tgid=sg1, tdma_slot=slot1)
+        if f1 != f2:
+            self.update_voice_frequency(f2, tgid=sg2, tdma_slot=slot2)
+        if f1:
+            updated += 1
+        if f2:
+            updated += 1
+        if self.debug > 10:
+            print "MOT_GRG_CN_GRANT_UPDT(0x03): freq %s sg1:%d freq %s sg2:%d" % (self.channel_id_to_string(ch1), sg1, self.channel_id_to_string(ch2), sg2)
+        return updated
+
+    def tsbk_grp_v_ch_grant_updt_exp(self, tsbk):	# TIA.102-AABC-B-2005 page 56
+        updated = 0
+        opts, ch1, ch2, ga = TSBK_GRP_V_CH_GRANT_UPDT_EXP(tsbk)
+        (PRI,E,P,D,M) = get_srv_options(opts)
+        f1, slot1 = self.channel_lookup(ch1)
+        if f1 == None: f1 = 0
+        self.update_voice_frequency(f1, tgid=ga, tdma_slot=slot1)
+        if f1 and P == 0:
+            updated += 1
+        if P == 1:
+            self.add_secure(ga)
+        if self.debug > 10:
+            print "tsbk03 grant update exp: ch %s freq %f ga %d" % (self.channel_id_to_string(ch1), f1 / 1000000.0, ga)
+        return updated
+
+    def tsbk_sndcp_data_ch(self, tsbk):
+        if self.debug > 10:
+            ch1, ch2 = TSBK_SNDCP_DATA_CH(tsbk)
+            print "tsbk16 sndcp data ch: chan %x %x" %(ch1, ch2)
+        return 0
+
+    def tsbk_iden_up_vu(self, tsbk):	# iden_up vhf uhf
+        iden, bwvu, toff0, spac, freq = TSBK_IDEN_UP_VU(tsbk)
+        toff_sign = (toff0 >> 13) & 1
+        toff = toff0 & 0x1fff
+        if toff_sign == 0:
+            toff = 0 - toff
+        txt = ["mob Tx-", "mob Tx+"]
+        self.update_freq_table(iden, {'offset': toff * spac * 125, 'step': spac * 125, 'frequency': freq * 5})
+        if self.debug > 10:
+            print "tsbk34 iden vhf/uhf id %d toff %f spac %f freq %f [%s]" % (iden, toff * spac * 0.125 * 1e-3, spac * 0.125, freq * 0.000005, txt[toff_sign])
+        return 0
+
+    def tsbk_iden_up_tdma(self, tsbk):
+        iden, channel_type, toff0, spac, f1 = TSBK_IDEN_UP_TDMA(tsbk)
+        toff_sign = (toff0 >> 13) & 1
+        toff = toff0 & 0x1fff
+        if toff_sign == 0:
+            toff = 0 - toff
+        slots_per_carrier = [1,1,1,2,4,2]
+        self.update_freq_table(iden, {'offset': toff * spac * 125, 'step': spac * 125, 'frequency': f1 * 5, 'tdma': slots_per_carrier[channel_type]})
+        if self.debug > 10:
+            print "tsbk33 iden up tdma id %d f %d offset %d spacing %d slots/carrier %d" % (iden, self.freq_table[iden]['frequency'], self.freq_table[iden]['offset'], self.freq_table[iden]['step'], self.freq_table[iden]['tdma'])
+        return 0
+
+    def tsbk_iden_up(self, tsbk):
+        iden, bw, toff0, spac, freq = TSBK_IDEN_UP(tsbk)
+        toff_sign = (toff0 >> 8) & 1
+        toff = toff0 & 0xff
+        if toff_sign == 0:
+            toff = 0 - toff
+        txt = ["mob xmit < recv", "mob xmit > recv"]
+        self.update_freq_table(iden, {'offset': toff * 250000, 'step': spac * 125, 'frequency': freq * 5})
+        if self.debug > 10:
+            print "tsbk3d iden id %d toff %f spac %f freq %f" % (iden, toff * 0.25, spac * 0.125, freq * 0.000005)
+        return 0
+
+    def tsbk_rfss_sts_bcst(self, tsbk):
+        syid, rfid, stid, chan = TSBK_RFSS_STS_BCST(tsbk)
+        f1 = self.channel_id_to_frequency(chan)
+        if f1:
+            self.rfss_syid = syid
+            self.rfss_rfid = rfid
+            self.rfss_stid = stid
+            self.rfss_chan = f1
+            self.rfss_txchan = f1 + self.freq_table[chan >> 12]['offset']
+        if self.debug > 10:
+            print "tsbk3a rfss status: syid: %x rfid %x stid %d ch1 %x(%s)" %(syid, rfid, stid, chan, self.channel_id_to_string(chan))
+        return 0
+
+    def tsbk_sccb(self, tsbk):	# secondary cc
+        rfid, stid, ch1, ch2 = TSBK_SCCB(tsbk)
+        f1 = self.channel_id_to_frequency(ch1)
+        f2 = self.channel_id_to_frequency(ch2)
+        if f1 and f2:
+            if f1 not in self.secondary:
                 self.secondary[ f1 ] = 1
+            if f2 not in self.secondary:
                 self.secondary[ f2 ] = 1
-                sorted_freqs = collections.OrderedDict(sorted(self.secondary.items()))
-                self.secondary = sorted_freqs
-            if self.debug > 10:
-                print "tsbk39 secondary cc: rfid %x stid %d ch1 %x(%s) ch2 %x(%s)" %(rfid, stid, ch1, self.channel_id_to_string(ch1), ch2, self.channel_id_to_string(ch2))
-        elif opcode == 0x3b:   # network status
-            wacn = (tsbk >> 52) & 0xfffff
-            syid = (tsbk >> 40) & 0xfff
-            ch1  = (tsbk >> 24) & 0xffff
-            f1 = self.channel_id_to_frequency(ch1)
-            if f1:
-                self.ns_syid = syid
-                self.ns_wacn = wacn
-                self.ns_chan = f1
-            if self.debug > 10:
-                print "tsbk3b net stat: wacn %x syid %x ch1 %x(%s)" %(wacn, syid, ch1, self.channel_id_to_string(ch1))
-        elif opcode == 0x3c:   # adjacent status
-            rfid = (tsbk >> 48) & 0xff
-            stid = (tsbk >> 40) & 0xff
-            ch1  = (tsbk >> 24) & 0xffff
-            table = (ch1 >> 12) & 0xf
-            f1 = self.channel_id_to_frequency(ch1)
-            if f1 and table in self.freq_table:
-                self.adjacent[f1] = 'rfid: %d stid:%d uplink:%f tbl:%d' % (rfid, stid, (f1 + self.freq_table[table]['offset']) / 1000000.0, table)
-            if self.debug > 10:
-                print "tsbk3c adjacent: rfid %x stid %d ch1 %x(%s)" %(rfid, stid, ch1, self.channel_id_to_string(ch1))
-                if table in self.freq_table:
-                    print "tsbk3c : %s %s" % (self.freq_table[table]['frequency'] , self.freq_table[table]['step'] )
-            #else:
-            #	print "tsbk other %x" % opcode
-        return updated
+        if self.debug > 10:
+            print "tsbk39 secondary cc: rfid %x stid %d ch1 %x(%s) ch2 %x(%s)" %(rfid, stid, ch1, self.channel_id_to_string(ch1), ch2, self.channel_id_to_string(ch2))
+        return 0
+
+    def tsbk_net_sts_bcst(self, tsbk):
+        wacn, syid, ch1 = TSBK_NET_STS_BCST(tsbk)
+        if self.warm_ns is not None:
+            self.check_warm_state(syid, wacn)
+        f1 = self.channel_id_to_frequency(ch1)
+        if f1:
+            self.ns_syid = syid
+            self.ns_wacn = wacn
+            self.ns_chan = f1
+        if self.debug > 10:
+            print "tsbk3b net stat: wacn %x syid %x ch1 %x(%s)" %(wacn, syid, ch1, self.channel_id_to_string(ch1))
+        return 0
+
+    def tsbk_adj_sts_bcst(self, tsbk):
+        rfid, stid, ch1 = TSBK_ADJ_STS_BCST(tsbk)
+        table = (ch1 >> 12) & 0xf
+        f1 = self.channel_id_to_frequency(ch1)
+        if f1 and table in self.freq_table:
+            self.adjacent[f1] = 'rfid: %d stid:%d uplink:%f tbl:%d' % (rfid, stid, (f1 + self.freq_table[table]['offset']) / 1000000.0, table)
+        if self.debug > 10:
+            print "tsbk3c adjacent: rfid %x stid %d ch1 %x(%s)" %(rfid, stid, ch1, self.channel_id_to_string(ch1))
+            if table in self.freq_table:
+                print "tsbk3c : %s %s" % (self.freq_table[table]['frequency'] , self.freq_table[table]['step'] )
+        return 0
+
+    # indexed by (opcode << 8) | mfrid; mfrid None matches any manufacturer
+    tsbk_dispatch = mk_dispatch([
+        ((0x00, None), tsbk_grp_v_ch_grant),
+        ((0x00, 0x90), tsbk_mot_grg_add_cmd),
+        ((0x01, 0x90), tsbk_mot_grg_del_cmd),
+        ((0x02, None), tsbk_grp_v_ch_grant_updt),
+        ((0x02, 0x90), tsbk_mot_grg_cn_grant),
+        ((0x03, None), tsbk_grp_v_ch_grant_updt_exp),
+        ((0x03, 0x90), tsbk_mot_grg_cn_grant_updt),
+        ((0x16, None), tsbk_sndcp_data_ch),
+        ((0x33, 0x00), tsbk_iden_up_tdma),
+        ((0x34, None), tsbk_iden_up_vu),
+        ((0x39, None), tsbk_sccb),
+        ((0x3a, None), tsbk_rfss_sts_bcst),
+        ((0x3b, None), tsbk_net_sts_bcst),
+        ((0x3c, None), tsbk_adj_sts_bcst),
+        ((0x3d, None), tsbk_iden_up)])
+
+    profile_names = PROFILE_NAMES[:]
+    tsbk_profile_index = mk_profile_index(tsbk_dispatch, profile_names, PROFILE_TSBK_OTHER)
+    mbt_profile_index = mk_profile_index(mbt_dispatch, profile_names, PROFILE_MBT_OTHER)
+
+    def get_profile(self):
+        messages = []
+        for key in xrange(len(self.msg_counts)):
+            if self.msg_counts[key]:
+                messages.append(('%s %02x/%02x' % (['tsbk', 'mbt'][key >> 14], (key >> 8) & 0x3f, key & 0xff), self.msg_counts[key]))
+        return tsys_profile(messages, self.profile.snapshot())
+
+    # learned system state, for the rx_ctl warm start cache
+    def get_state(self):
+        return {'freq_table': dict(self.freq_table),
+                'rfss': (self.rfss_syid, self.rfss_rfid, self.rfss_stid, self.rfss_chan, self.rfss_txchan),
+                'ns': (self.ns_syid, self.ns_wacn, self.ns_chan),
+                'secondary': self.secondary.keys(),
+                'adjacent': dict(self.adjacent),
+                'trunk_cc': self.trunk_cc}
+
+    # warm start from a get_state() saved by an earlier run, so that grants
+    # resolve (and TDMA grants can be followed) before the IDEN_UP and
+    # network status broadcasts come around again.  The first network
+    # status checks the cached state: if it is from another system, every
+    # cached entry not rebroadcast by then is dropped
+    def load_state(self, state):
+        for iden in state['freq_table']:
+            self.update_freq_table(iden, state['freq_table'][iden])
+        self.rfss_syid, self.rfss_rfid, self.rfss_stid, self.rfss_chan, self.rfss_txchan = state['rfss']
+        self.ns_syid, self.ns_wacn, self.ns_chan = state['ns']
+        for f in state['secondary']:
+            self.secondary[f] = 1
+        self.adjacent.update(state['adjacent'])
+        if state['trunk_cc'] in self.cc_list:
+            self.trunk_cc = state['trunk_cc']
+            self.cc_list_index = self.cc_list.index(self.trunk_cc)
+        self.warm_idens = set(state['freq_table'])
+        if self.ns_syid >= 0 and self.ns_wacn >= 0:
+            self.warm_ns = (self.ns_syid, self.ns_wacn)
+
+    def check_warm_state(self, syid, wacn):
+        if (syid, wacn) != self.warm_ns:
+            print 'cached state is for syid %x wacn %x, not syid %x wacn %x; discarding it' % (self.warm_ns[0], self.warm_ns[1], syid, wacn)
+            for iden in self.warm_idens:
+                del self.freq_table[iden]
+                self.chan_table[iden<<12:(iden+1)<<12] = UNBUILT_CHANNELS
+            self.tsbk_cache = {}
+            self.secondary = sorted_dict()
+            self.adjacent = {}
+            self.rfss_syid = 0
+            self.rfss_rfid = 0
+            self.rfss_stid = 0
+            self.rfss_chan = 0
+            self.rfss_txchan = 0
+            self.ns_syid = -1	# until a network status resolves, no TDMA
+            self.ns_wacn = -1
+            self.ns_chan = 0
+        self.warm_idens = set()
+        self.warm_ns = None
 
     def hunt_cc(self, curr_time):
         if self.cc_timeouts < 6:
@@ -507,13 +1022,87 @@ class trunked_system (object):
         self.trunk_cc = self.cc_list[self.cc_list_index]
         print '%f set trunk_cc to %s' % (curr_time, self.trunk_cc)
 
-def get_int_dict(s):
+class sim_clock(object):
+    # drop-in for time.time when replaying recorded traffic; the replay
+    # sets the time from the message timestamps, so holds and timeouts
+    # behave as they did live however fast the messages are fed in
+    def __init__(self, t=0.0):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+    def set(self, t):
+        self.t = t
+
+class tgid_filter(object):
+    # set of 16-bit talkgroup ids, held as a 65536-bit bitmap
+    def __init__(self, bits=None, count=0):
+        if bits is None:
+            bits = bytearray(0x10000 >> 3)
+        self.bits = bits
+        self.count = count
+
+    def __contains__(self, tgid):
+        try:
+            return self.bits[tgid >> 3] & (1 << (tgid & 7)) != 0
+        except (TypeError, IndexError):	# None, or not a 16-bit id
+            return False
+
+    def __len__(self):
+        return self.count
+
+    def add(self, tgid):
+        assert 0 <= tgid <= 0xffff
+        if tgid not in self:
+            self.bits[tgid >> 3] |= 1 << (tgid & 7)
+            self.count += 1
+
+    def add_range(self, first, last):
+        for tgid in xrange(first, last + 1):
+            self.add(tgid)
+
+    def copy(self):
+        return tgid_filter(bytearray(self.bits), self.count)
+
+tgid_filters = {}	# loaded filters, shared by all systems naming the same list or file
+
+# comma separated list or file name; ids and ranges (1000-1999) may be
+# separated by commas or newlines.  An entry that is not a 16-bit id or
+# range is reported with its file and line and skipped
+def get_tgid_filter(s):
+    if s in tgid_filters:
+        return tgid_filters[s]
     if s[0].isdigit():
-        return dict.fromkeys([int(d) for d in s.split(',')])
-    return dict.fromkeys([int(d) for d in open(s).readlines()])
+        lines = [s]
+    else:
+        lines = open(s).read().split('\n')
+    f = tgid_filter()
+    for lineno, line in enumerate(lines, 1):
+        for item in line.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            try:
+                if '-' in item:
+                    first, last = [int(v) for v in item.split('-')]
+                else:
+                    first = last = int(item)
+            except ValueError:
+                first = last = -1
+            if not 0 <= first <= last <= 0xffff:
+                where = s if s[0].isdigit() else '%s line %d' % (s, lineno)
+                print 'tgid filter %s: ignoring %s, not a 16-bit talkgroup id or range' % (where, item)
+                continue
+            if first == last:
+                f.add(first)
+            else:
+                f.add_range(first, last)
+    tgid_filters[s] = f
+    return f
 
 class rx_ctl (object):
-    def __init__(self, debug=0, frequency_set=None, conf_file=None, logfile_workers=None):
+    def __init__(self, debug=0, frequency_set=None, conf_file=None, logfile_workers=None, clock=time.time, latency_log=None, state_dir=None, add_workers=None):
         class _states(object):
             ACQ = 0
             CC = 1
@@ -525,30 +1114,51 @@ class rx_ctl (object):
         self.trunked_systems = {}
         self.frequency_set = frequency_set
         self.debug = debug
+        self.clock = clock
+        self.profile = decode_profile(RX_PROFILE_NAMES)
+        self.latency = latency_tracker(latency_log)
+        self.lock = threading.Lock()	# process_qmsgs (watcher thread) against to_string
+        self.grant_stamp = None	# grant_stamp of the batch being scheduled
         self.tgid_hold = None
-        self.tgid_hold_until = time.time()
+        self.tgid_hold_until = self.clock()
         self.TGID_HOLD_TIME = 2.0	# TODO: make more configurable
         self.TGID_SKIP_TIME = 1.0	# TODO: make more configurable
         self.current_nac = None
         self.current_id = 0
         self.TSYS_HOLD_TIME = 3.0	# TODO: make more configurable
-        self.wait_until = time.time()
+        self.wait_until = self.clock()
         self.configs = {}
         self.last_tdma_vf = 0
         self.P2_GRACE_TIME = 1.0	# TODO: make more configurable
         self.logfile_workers = logfile_workers
+        self.add_workers = add_workers	# add_workers(n, demod_type): grow logfile_workers, returns number added
         self.active_talkgroups = {}
         self.working_frequencies = {}
         self.xor_cache = {}
         self.last_garbage_collect = 0
-        if self.logfile_workers:
-            self.input_rate = self.logfile_workers[0]['demod'].input_rate
+        self.config_sources = []	# files read by build_config*/setup_config
+        self.state_dir = state_dir	# warm start cache, one file per nac
+        if state_dir and not os.path.isdir(state_dir):
+            try:
+                os.makedirs(state_dir)
+            except OSError, e:
+                print 'unable to create cache directory %s: %s; state will not be cached' % (state_dir, e)
+                self.state_dir = None
+        self.saved_state = {}	# nac -> state last written
+        self.STATE_SAVE_TIME = 10.0
+        self.next_state_save = 0
+        if self.logfile_workers:	# else built later, see worker_pool
+            for worker in self.logfile_workers:
+                worker['demod'].set_idle(True)	# until assigned a frequency
 
         if conf_file:
-            if conf_file.endswith('.tsv'):
-                self.build_config_tsv(conf_file)
-            else:
-                self.build_config(conf_file)
+            if not self.load_config_cache(conf_file):
+                self.config_sources = [conf_file]
+                if conf_file.endswith('.tsv'):
+                    self.build_config_tsv(conf_file)
+                else:
+                    self.build_config(conf_file)
+                self.save_config_cache(conf_file)
             self.nacs = self.configs.keys()
             self.current_nac = self.nacs[0]
             self.current_state = self.states.CC
@@ -574,7 +1184,10 @@ class rx_ctl (object):
     def set_frequency(self, params):
         frequency = params['freq']
         if frequency and self.frequency_set:
+            t_request = time.time()
             self.frequency_set(params)
+            if self.grant_stamp and params['tgid'] is not None:
+                self.latency.add(self.grant_stamp, t_request, time.time(), params['tgid'], frequency)
 
     def add_trunked_system(self, nac):
         assert nac not in self.trunked_systems	# duplicate nac not allowed
@@ -584,7 +1197,43 @@ class rx_ctl (object):
         cfg = None
         if nac in self.configs:
             cfg = self.configs[nac]
-        self.trunked_systems[nac] = trunked_system(debug = self.debug, config=cfg)
+        self.trunked_systems[nac] = trunked_system(debug = self.debug, config=cfg, clock=self.clock)
+        if self.state_dir:
+            self.load_state(nac)
+
+    def state_filename(self, nac):
+        return os.path.join(self.state_dir, 'nac-%x.state' % nac)
+
+    def load_state(self, nac):
+        try:
+            with open(self.state_filename(nac), 'rb') as f:
+                state = pickle.load(f)
+        except IOError:
+            return	# nothing cached for this system yet
+        except Exception, e:
+            print 'ignoring unreadable state cache %s: %s' % (self.state_filename(nac), e)
+            return
+        self.trunked_systems[nac].load_state(state)
+        self.saved_state[nac] = state
+        print 'loaded cached state for nac 0x%x: %d iden table(s), syid %x wacn %x' % (nac, len(state['freq_table']), state['ns'][0], state['ns'][1])
+
+    def save_state(self):
+        # write the state of each system that changed since it was last saved;
+        # written to a temporary file and renamed, so a crash never leaves
+        # a partial cache behind
+        for nac in self.trunked_systems:
+            state = self.trunked_systems[nac].get_state()
+            if state == self.saved_state.get(nac):
+                continue
+            filename = self.state_filename(nac)
+            try:
+                with open(filename + '.tmp', 'wb') as f:
+                    pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+                os.rename(filename + '.tmp', filename)
+            except (IOError, OSError), e:
+                print 'unable to write state cache %s: %s' % (filename, e)
+                continue
+            self.saved_state[nac] = state
 
     def build_config_tsv(self, tsv_filename):
         import csv
@@ -626,9 +1275,60 @@ class rx_ctl (object):
             configs[nac]['sysname'] = section
         self.setup_config(configs)
 
+    # compiled trunk configuration cache.  <conf file name>-<path hash>.cache,
+    # in the --cache-dir if one is given and in the per-user cache
+    # directory otherwise, holds the configs built by setup_config (cc
+    # lists, filters, tgid maps), keyed on the path, mtime and size of the
+    # conf file and of every file it references, so an unchanged
+    # configuration is loaded without parsing
+    CONFIG_CACHE_VERSION = 1
+    CONFIG_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'op25')
+
+    def config_cache_filename(self, conf_file):
+        path = os.path.abspath(conf_file)
+        name = '%s-%08x.cache' % (os.path.basename(path), zlib.crc32(path) & 0xffffffff)
+        return os.path.join(self.state_dir or self.CONFIG_CACHE_DIR, name)
+
+    def config_cache_key(self, sources):
+        key = [self.CONFIG_CACHE_VERSION]
+        for filename in sources:
+            st = os.stat(filename)
+            key.append((os.path.abspath(filename), st.st_mtime, st.st_size))
+        return key
+
+    def load_config_cache(self, conf_file):
+        try:
+            with open(self.config_cache_filename(conf_file), 'rb') as f:
+                key, sources, configs = pickle.load(f)
+            if key != self.config_cache_key(sources):
+                return False	# stale, some source has changed
+        except Exception:
+            return False	# missing or unreadable, rebuild it
+        self.config_sources = sources
+        self.configs = configs
+        for nac in configs:
+            self.add_trunked_system(nac)
+        return True
+
+    def add_config_source(self, filename):
+        if filename not in self.config_sources:
+            self.config_sources.append(filename)
+
+    def save_config_cache(self, conf_file):
+        filename = self.config_cache_filename(conf_file)
+        try:
+            if not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            key = self.config_cache_key(self.config_sources)
+            with open(filename + '.tmp', 'wb') as f:
+                pickle.dump((key, self.config_sources, self.configs), f, pickle.HIGHEST_PROTOCOL)
+            os.rename(filename + '.tmp', filename)
+        except (IOError, OSError), e:
+            print 'unable to write config cache for %s: %s' % (conf_file, e)
+
     def setup_config(self, configs):
         for nac in configs:
-            self.configs[nac] = {'cclist':[], 'offset':0, 'whitelist':None, 'blacklist':{}, 'tgid_map':{}, 'sysname': configs[nac]['sysname'], 'center_frequency': None}
+            self.configs[nac] = {'cclist':[], 'offset':0, 'whitelist':None, 'blacklist':None, 'tgid_map':{}, 'sysname': configs[nac]['sysname'], 'center_frequency': None}
             for f in configs[nac]['control_channel_list'].split(','):
                 self.configs[nac]['cclist'].append(get_frequency(f))
             if 'offset' in configs[nac]:
@@ -639,8 +1339,11 @@ class rx_ctl (object):
                 self.configs[nac]['modulation'] = 'cqpsk'
             for k in ['whitelist', 'blacklist']:
                 if k in configs[nac]:
-                    self.configs[nac][k] = get_int_dict(configs[nac][k])
+                    self.configs[nac][k] = get_tgid_filter(configs[nac][k])
+                    if not configs[nac][k][0].isdigit():
+                        self.add_config_source(configs[nac][k])
             if 'tgid_tags_file' in configs[nac]:
+                self.add_config_source(configs[nac]['tgid_tags_file'])
                 import csv
                 with open(configs[nac]['tgid_tags_file'], 'rb') as csvfile:
                     sreader = csv.reader(csvfile, delimiter='\t', quotechar='"', quoting=csv.QUOTE_ALL)
@@ -659,77 +1362,142 @@ class rx_ctl (object):
             self.current_id = 0
         return self.nacs[self.current_id]
 
-    def to_string(self):
+    def to_string(self):	# may be called from any thread
         s = ''
-        for nac in self.trunked_systems:
-            s += '\n====== NAC 0x%x ====== %s ======\n' % (nac, self.trunked_systems[nac].sysname)
-            s += self.trunked_systems[nac].to_string()
+        with self.lock:
+            for nac in self.trunked_systems:
+                s += '\n====== NAC 0x%x ====== %s ======\n' % (nac, self.trunked_systems[nac].sysname)
+                s += self.trunked_systems[nac].to_string()
+            s += self.profile_string()
         return s
 
+    def get_profile(self):
+        systems = dict([(nac, self.trunked_systems[nac].get_profile()) for nac in self.trunked_systems])
+        return rx_profile(systems, self.profile.snapshot(), self.latency.snapshot())
+
+    def profile_string(self):
+        profile = self.get_profile()
+        s = []
+        for nac in sorted(profile.systems):
+            p = profile.systems[nac]
+            s.append('====== NAC 0x%x decode profile ======' % nac)
+            msgs = ['%s:%d' % m for m in p.messages]
+            for i in xrange(0, len(msgs), 6):
+                s.append('messages: %s' % ' '.join(msgs[i:i+6]))
+            s += profile_lines(p.handlers)
+        s.append('====== scheduler profile ======')
+        s += profile_lines(profile.commands)
+        if profile.latency:
+            s.append('====== grant to tune latency ======')
+            s += profile_lines(profile.latency)
+        return '\n'.join(s) + '\n'
+
     def process_qmsg(self, msg):
-        type = msg.type()
+        self.process_qmsgs([msg])
+
+    # a batch of messages drained from the queue.  Messages are decoded in
+    # order and gui commands, timeouts and voice/tdma duids are applied to
+    # the state machine as they come, with back-to-back repeats of a duid
+    # collapsed.  The scheduler then runs once for the whole batch
+    def process_qmsgs(self, msgs):
+        with self.lock:
+            self.handle_qmsgs(msgs)
+
+    def handle_qmsgs(self, msgs):
+        # assumes lock held
+        curr_time = self.clock()
+        t_dequeued = time.time()
+        t_queued = None	# queue time of the first grant in the batch
         updated = 0
-        curr_time = time.time()
-        if type == -2:	# request from gui
-            cmd = msg.to_string()
+        repeats = 0	# grant updates answered from tsbk_cache
+        trunk_type = None	# last TSBK/MBT type seen on the current nac
+        schedule = False
+        last_cmd = None
+        nacs, tsbks, crcs = qmsg_decode(msgs)
+        for i, msg in enumerate(msgs):
+            type = msg.type()
+            if type == -2:	# request from gui
+                cmd = msg.to_string()
+                if self.debug > 10:
+                    print "process_qmsg: command: %s" % cmd
+                self.update_state(cmd, curr_time)
+                last_cmd = None
+                continue
+            elif type == -1:	# timeout
+                print "process_data_unit timeout"
+                self.update_state('timeout', curr_time)
+                schedule = True
+                last_cmd = None
+                continue
+            elif type < 0:
+                print 'unknown message type %d' % (type)
+                continue
+            nac = nacs[i]	# nac is always 1st two bytes
+            if nac == 0xffff:
+                # TDMA
+                cmd = 'tdma_duid%d' % type
+                if cmd != last_cmd:
+                    self.update_state(cmd, curr_time)
+                    last_cmd = cmd
+                continue
             if self.debug > 10:
-                print "process_qmsg: command: %s" % cmd
-            self.update_state(cmd, curr_time)
-            return
-        elif type == -1:	# timeout
-            print "process_data_unit timeout"
-            self.update_state('timeout', curr_time)
+                print "nac %x type %d at %f state %d len %d" %(nac, type, self.clock(), self.state, len(msg.to_string()) - 2)
+            if (type == 7 or type == 12) and nac not in self.trunked_systems:
+                if not self.configs:
+                    # TODO: allow whitelist/blacklist rather than blind automatic-add
+                    self.add_trunked_system(nac)
+                else:
+                    continue
+            rc = 0
+            if type == 7:	# trunk: TSBK
+                rc = self.trunked_systems[nac].decode_tsbk(tsbks[i], None if crcs is None else crcs[i])
+                if rc != 0 and t_queued is None and nac == self.current_nac:	# a grant, or a repeat of one
+                    t_queued = msg.arg1() or t_dequeued	# zero if not stamped
+            elif type == 12:	# trunk: MBT
+                nac, hi, lo, data_hi, data_lo = QMSG_MBT.unpack_from(msg.to_string())
+                header = (hi << 32) | lo
+                mbt_data = (data_hi << 32) | data_lo
+                opcode = (header >> 32) & 0x3f
+                if self.debug > 10:
+                    print "type %d at %f state %d len %d/%d opcode %x [%x/%x]" %(type, self.clock(), self.state, 12, 12, opcode, header,mbt_data)
+                self.trunked_systems[nac].decode_mbt_data(opcode, header, mbt_data)
+
+            if nac != self.current_nac:
+                continue
+
             if self.logfile_workers:
-                self.logging_scheduler(curr_time)
-            return
-        elif type < 0:
-            print 'unknown message type %d' % (type)
-            return
-        s = msg.to_string()
-        # nac is always 1st two bytes
-        nac = (ord(s[0]) << 8) + ord(s[1])
-        if nac == 0xffff:
-            # TDMA
-            self.update_state('tdma_duid%d' % type, curr_time)
-            return
-        s = s[2:]
-        if self.debug > 10:
-            print "nac %x type %d at %f state %d len %d" %(nac, type, time.time(), self.state, len(s))
-        if (type == 7 or type == 12) and nac not in self.trunked_systems:
-            if not self.configs:
-                # TODO: allow whitelist/blacklist rather than blind automatic-add
-                self.add_trunked_system(nac)
+                if rc >= 0:	# a repeated grant update has nothing new to schedule
+                    schedule = True
+            elif type == 7 or type == 12:
+                if rc < 0:
+                    repeats += 1
+                else:
+                    updated += rc
+                trunk_type = type
             else:
-                return
-        if type == 7:	# trunk: TSBK
-            t = 0
-            for c in s:
-                t = (t << 8) + ord(c)
-            updated += self.trunked_systems[nac].decode_tsbk(t)
-        elif type == 12:	# trunk: MBT
-            s1 = s[:12]
-            s2 = s[12:]
-            header = mbt_data = 0
-            for c in s1:
-                header = (header << 8) + ord(c)
-            for c in s2:
-                mbt_data = (mbt_data << 8) + ord(c)
-            opcode = (header >> 32) & 0x3f
-            if self.debug > 10:
-                print "type %d at %f state %d len %d/%d opcode %x [%x/%x]" %(type, time.time(), self.state, len(s1), len(s2), opcode, header,mbt_data)
-            self.trunked_systems[nac].decode_mbt_data(opcode, header, mbt_data)
-
-        if nac != self.current_nac:
-            return
+                cmd = 'duid%d' % type
+                if cmd != last_cmd or type == 15:	# like timeouts, every duid15 counts
+                    self.update_state(cmd, curr_time)
+                    last_cmd = cmd
 
+        if t_queued is not None:
+            self.grant_stamp = grant_stamp(t_queued, t_dequeued, time.time())
         if self.logfile_workers:
-            self.logging_scheduler(curr_time)
-            return
-
-        if updated:
+            if schedule:
+                self.logging_scheduler(curr_time)
+        elif updated or repeats:
             self.update_state('update', curr_time)
-        else:
-            self.update_state('duid%d' % type, curr_time)
+        elif trunk_type is not None:
+            self.update_state('duid%d' % trunk_type, curr_time)
+        self.grant_stamp = None
+        if self.state_dir and self.next_state_save <= curr_time:
+            self.next_state_save = curr_time + self.STATE_SAVE_TIME
+            self.save_state()
+
+    def worker_demod_type(self):	# demodulator chain for the current system
+        if self.current_nac is not None and self.trunked_systems[self.current_nac].modulation == 'c4fm':
+            return 'fsk4'
+        return 'cqpsk'
 
     def find_available_worker(self):
         for worker in self.logfile_workers:
@@ -739,94 +1507,112 @@ class rx_ctl (object):
         return None
 
     def free_frequency(self, frequency, curr_time):
-        assert not self.working_frequencies[frequency]['tgids']
-        self.working_frequencies[frequency]['worker']['demod'].set_relative_frequency(0)
-        self.working_frequencies[frequency]['worker']['active'] = False
+        assert not self.working_frequencies[frequency].tgids
+        self.working_frequencies[frequency].worker['demod'].set_idle(True)
+        self.working_frequencies[frequency].worker['demod'].set_relative_frequency(0)
+        self.working_frequencies[frequency].worker['active'] = False
         self.working_frequencies.pop(frequency)
         print '%f release worker frequency %d' % (curr_time, frequency)
 
     def free_talkgroup(self, frequency, tgid, curr_time):
-        decoder = self.working_frequencies[frequency]['worker']['decoder']
-        tdma_slot = self.working_frequencies[frequency]['tgids'][tgid]['tdma_slot']
+        decoder = self.working_frequencies[frequency].worker['decoder']
+        tdma_slot = self.working_frequencies[frequency].tgids[tgid].tdma_slot
         index = tdma_slot
         if tdma_slot is None:
             index = 0
         filename = 'idle-channel-%d-%d-%f.wav' % (frequency, index, curr_time)
         decoder.set_output(filename, index=index)
-        self.working_frequencies[frequency]['tgids'].pop(tgid)
+        self.working_frequencies[frequency].tgids.pop(tgid)
         print '%f release tgid %d frequency %d' % (curr_time, tgid, frequency)
 
     def logging_scheduler(self, curr_time):
+        t0 = time.time()
         tsys = self.trunked_systems[self.current_nac]
-        for tgid in tsys.get_updated_talkgroups(curr_time):
-            frequency = tsys.talkgroups[tgid]['frequency']
-            tdma_slot = tsys.talkgroups[tgid]['tdma_slot']
-            # see if this tgid active on any other freq(s)
-            other_freqs = [f for f in self.working_frequencies if f != frequency and tgid in self.working_frequencies[f]['tgids']]
-            if other_freqs:
-                print '%f tgid %d slot %s frequency %d found on other frequencies %s' % (curr_time, tgid, tdma_slot, frequency, ','.join(['%s' % f for f in other_freqs]))
-                for f in other_freqs:
-                    self.free_talkgroup(f, tgid, curr_time)
-                    if not self.working_frequencies[f]['tgids']:
-                        self.free_frequency(f, curr_time)
-            diff = abs(tsys.center_frequency - frequency)
-            if diff > self.input_rate/2:
-                #print '%f request for frequency %d tgid %d failed, offset %d exceeds maximum %d' % (curr_time, frequency, tgid, diff, self.input_rate/2)
-                continue
-
-            update = True
-            if frequency in self.working_frequencies:
-                tgids = self.working_frequencies[frequency]['tgids']
-                if tgid in tgids:
-                    if tgids[tgid]['tdma_slot'] == tdma_slot:
-                        update = False
-                    else:
-                        print '%f slot switch %s was %s tgid %d frequency %d' % (curr_time, tdma_slot, tgids[tgid]['tdma_slot'], tgid, frequency)
-                        worker = self.working_frequencies[frequency]['worker']
+        pending = [tgid for tgid in tsys.get_updated_talkgroups(curr_time) if not self.schedule_talkgroup(tsys, tgid, curr_time)]
+        if pending and self.add_workers:
+            # grow the pool once for the whole pass, then retry
+            if self.add_workers(len(set([tsys.talkgroups[tgid].frequency for tgid in pending])), self.worker_demod_type()):
+                pending = [tgid for tgid in pending if not self.schedule_talkgroup(tsys, tgid, curr_time)]
+        for tgid in pending:
+            print '*** error, no free demodulators, freq %d tgid %d' % (tsys.talkgroups[tgid].frequency, tgid)
+
+        if self.last_garbage_collect + 1 <= curr_time:
+            self.garbage_collect(curr_time)
+        self.profile.add(PROFILE_LOGGING_SCHEDULER, time.time() - t0)
+
+    def schedule_talkgroup(self, tsys, tgid, curr_time):
+        # assign tgid a worker; False if none is free
+        frequency = tsys.talkgroups[tgid].frequency
+        tdma_slot = tsys.talkgroups[tgid].tdma_slot
+        # see if this tgid active on any other freq(s)
+        other_freqs = [f for f in self.working_frequencies if f != frequency and tgid in self.working_frequencies[f].tgids]
+        if other_freqs:
+            print '%f tgid %d slot %s frequency %d found on other frequencies %s' % (curr_time, tgid, tdma_slot, frequency, ','.join(['%s' % f for f in other_freqs]))
+            for f in other_freqs:
+                self.free_talkgroup(f, tgid, curr_time)
+                if not self.working_frequencies[f].tgids:
+                    self.free_frequency(f, curr_time)
+        diff = abs(tsys.center_frequency - frequency)
+        input_rate = self.logfile_workers[0]['demod'].input_rate
+        if diff > input_rate/2:
+            #print '%f request for frequency %d tgid %d failed, offset %d exceeds maximum %d' % (curr_time, frequency, tgid, diff, input_rate/2)
+            return True
+
+        update = True
+        if frequency in self.working_frequencies:
+            tgids = self.working_frequencies[frequency].tgids
+            if tgid in tgids:
+                if tgids[tgid].tdma_slot == tdma_slot:
+                    update = False
                 else:
-                    #active_tdma_slots = [tgids[tg]['tdma_slot'] for tg in tgids]
-                    print '%f new tgid %d slot %s arriving on already active frequency %d' % (curr_time, tgid, tdma_slot, frequency)
-                    worker = self.working_frequencies[frequency]['worker']
+                    print '%f slot switch %s was %s tgid %d frequency %d' % (curr_time, tdma_slot, tgids[tgid].tdma_slot, tgid, frequency)
+                    worker = self.working_frequencies[frequency].worker
             else:
-                worker = self.find_available_worker()
-                if worker is None:
-                    print '*** error, no free demodulators, freq %d tgid %d' % (frequency, tgid)
-                    continue
-                self.working_frequencies[frequency] = {'tgids' : {}, 'worker': worker}
-                worker['demod'].set_relative_frequency(tsys.center_frequency - frequency)
-                print '%f starting worker frequency %d tg %d slot %s' % (curr_time, frequency, tgid, tdma_slot)
-            self.working_frequencies[frequency]['tgids'][tgid] = {'updated': curr_time, 'tdma_slot': tdma_slot}
-            if not update:
-                continue
-            filename = 'tgid-%d-%f.wav' % (tgid, curr_time)
-            print '%f update frequency %d tg %d slot %s file %s' % (curr_time, frequency, tgid, tdma_slot, filename)
-            # set demod speed, decoder slot, output file name
-            demod = worker['demod']
-            decoder = worker['decoder']
-            symbol_rate = 4800
-
-            if tdma_slot is None:
-                index = 0
-            else:
-                index = tdma_slot
-                symbol_rate = 6000
-                xorhash = '%x%x%x' % (self.current_nac, tsys.ns_syid, tsys.ns_wacn)
-                if xorhash not in self.xor_cache:
-                    self.xor_cache[xorhash] = lfsr.p25p2_lfsr(self.current_nac, tsys.ns_syid, tsys.ns_wacn).xor_chars
-                decoder.set_xormask(self.xor_cache[xorhash], xorhash, index=index)
-            demod.set_omega(symbol_rate)
-            decoder.set_output(filename, index=index)
-
-        # garbage collection
-        if self.last_garbage_collect + 1 > curr_time:
-            return
+                #active_tdma_slots = [tgids[tg].tdma_slot for tg in tgids]
+                print '%f new tgid %d slot %s arriving on already active frequency %d' % (curr_time, tgid, tdma_slot, frequency)
+                worker = self.working_frequencies[frequency].worker
+        else:
+            worker = self.find_available_worker()
+            if worker is None:
+                return False
+            self.working_frequencies[frequency] = working_frequency(worker)
+            t_request = time.time()
+            worker['demod'].set_relative_frequency(tsys.center_frequency - frequency)
+            worker['demod'].set_idle(False)
+            if self.grant_stamp:
+                self.latency.add(self.grant_stamp, t_request, time.time(), tgid, frequency)
+            print '%f starting worker frequency %d tg %d slot %s' % (curr_time, frequency, tgid, tdma_slot)
+        self.working_frequencies[frequency].tgids[tgid] = working_tgid(curr_time, tdma_slot)
+        if not update:
+            return True
+        filename = 'tgid-%d-%f.wav' % (tgid, curr_time)
+        print '%f update frequency %d tg %d slot %s file %s' % (curr_time, frequency, tgid, tdma_slot, filename)
+        # set demod speed, decoder slot, output file name
+        demod = worker['demod']
+        decoder = worker['decoder']
+        symbol_rate = 4800
+
+        if tdma_slot is None:
+            index = 0
+        else:
+            index = tdma_slot
+            symbol_rate = 6000
+            xorhash = '%x%x%x' % (self.current_nac, tsys.ns_syid, tsys.ns_wacn)
+            if xorhash not in self.xor_cache:
+                self.xor_cache[xorhash] = lfsr.p25p2_lfsr(self.current_nac, tsys.ns_syid, tsys.ns_wacn).xor_chars
+            decoder.set_xormask(self.xor_cache[xorhash], xorhash, index=index)
+        demod.set_omega(symbol_rate)
+        decoder.set_output(filename, index=index)
+        return True
+
+    def garbage_collect(self, curr_time):
         self.last_garbage_collect = curr_time
 
         gc_frequencies = []
         gc_tgids = []
         for frequency in self.working_frequencies:
-            tgids = self.working_frequencies[frequency]['tgids']
-            inactive_tgids = [[frequency, tgid] for tgid in tgids if tgids[tgid]['updated'] + self.TGID_HOLD_TIME < curr_time]
+            tgids = self.working_frequencies[frequency].tgids
+            inactive_tgids = [[frequency, tgid] for tgid in tgids if tgids[tgid].updated + self.TGID_HOLD_TIME < curr_time]
             if len(inactive_tgids) == len(tgids):
                 gc_frequencies += [frequency]
             gc_tgids += inactive_tgids
@@ -838,6 +1624,7 @@ class rx_ctl (object):
     def update_state(self, command, curr_time):
         if not self.configs:
             return	# run in "manual mode" if no conf
+        t0 = time.time()
 
         nac = self.current_nac
         tsys = self.trunked_systems[nac]
@@ -933,6 +1720,30 @@ class rx_ctl (object):
         if new_state:
             self.current_state = new_state
 
+        self.profile.add(RX_PROFILE_INDEX.get(command, 0), time.time() - t0)
+
+# drains the decoder message queue and hands each batch to callback
+# (rx_ctl.process_qmsgs), optionally recording it
+class du_queue_watcher(threading.Thread):
+
+    def __init__(self, msgq,  callback, recorder=None, **kwds):
+        threading.Thread.__init__ (self, **kwds)
+        self.setDaemon(1)
+        self.msgq = msgq
+        self.callback = callback
+        self.recorder = recorder
+        self.keep_running = True
+        self.start()
+
+    def run(self):
+        while(self.keep_running):
+            msgs = [self.msgq.delete_head()]	# blocks until there is work
+            while not self.msgq.empty_p():	# then drain whatever else is queued
+                msgs.append(self.msgq.delete_head_nowait())
+            if self.recorder:
+                self.recorder.write(msgs, time.time())
+            self.callback(msgs)
+
 def main():
     q = 0x3a000012ae01013348704a54
     rc = crc16(q,12)
@@ -944,12 +1755,66 @@ def main():
     print "should be nonzero: %x" % rc
     assert rc != 0
 
+    blocks = np.array([[(q >> (i*8)) & 0xff for i in xrange(11, -1, -1)] for q in [0x3a000012ae01013348704a54, 0x3a001012ae01013348704a54]], dtype=np.uint8)
+    rc = crc16_batch(blocks)
+    print "batch should be zero, nonzero: %x %x" % (rc[0], rc[1])
+    assert rc[0] == 0 and rc[1] != 0
+
     t = trunked_system(debug=255)
-    q = 0x3a000012ae0101334870
+    q = 0x3a000012ae01013348704a54
     t.decode_tsbk(q)
 
-    q = 0x02900031210020018e7c
+    q = 0x02900031210020018e7cdb8f
+    t.decode_tsbk(q)
+
+    q = 0x02900031210020018e7cdb8e
+    t.decode_tsbk(q)
+    assert t.stats['crc'] == 1
+
+    q = 0x3a000012ae01013300ea0e81	# crc32 valid, crc16 not
+    assert crc32(q >> 32, 8) == 0x00ea0e81	# as p25p1_fdma.cc
+    assert crc16(q,12) != 0 and tsbk_crc_ok(q) and not tsbk_crc_ok(q ^ 1)
+    t.decode_tsbk(q)
+    assert t.stats['crc'] == 1
+
+    def mk_tsbk(fields):	# (shift, value) pairs, with crc
+        tsbk = 0
+        for shift, value in fields:
+            tsbk |= value << shift
+        return tsbk + crc16(tsbk, 12)
+
+    clock = sim_clock(1000.0)
+    t = trunked_system(clock=clock)
+    t.decode_tsbk(mk_tsbk([(88, 0x3d), (76, 1), (67, 0x64), (48, 100), (16, 851006250 / 5)]))	# iden_up
+    q = mk_tsbk([(88, 0x02), (64, 0x1001), (48, 100), (32, 0x1002), (16, 200)])	# grant update
     t.decode_tsbk(q)
+    clock.set(1000.1)
+    assert t.decode_tsbk(q) == -1 and t.talkgroups[100].time == 1000.1
+    t.decode_tsbk(mk_tsbk([(88, 0x00), (72, 0x40), (56, 0x1001), (40, 100), (16, 0x123456)]))	# encrypted grant
+    clock.set(1000.2)
+    assert t.decode_tsbk(q) == 0 and t.talkgroups[100].time == 1000.1	# not refreshed by the cached copy
+
+    f = get_tgid_filter('100,70000,7-3,200-210')	# out of range entries are skipped
+    assert len(f) == 12 and 100 in f and 205 in f and 7 not in f
+
+    t = trunked_system(clock=clock)	# find_talkgroup order
+    t.decode_tsbk(mk_tsbk([(88, 0x3d), (76, 1), (67, 0x64), (48, 100), (16, 851006250 / 5)]))
+    for tgid, ch, now in [(300, 0x1002, 1001.0), (100, 0x1001, 1001.1), (300, 0x1002, 1001.2), (200, 0x1003, 1001.3)]:
+        clock.set(now)
+        t.decode_tsbk(mk_tsbk([(88, 0x02), (64, ch), (48, tgid), (32, ch), (16, tgid)]))
+    assert t.find_talkgroup(1001.0)[1] == 100	# 300 was updated again since
+    assert t.find_talkgroup(1001.0, tgid=300)[1] == 300	# held talkgroup first
+    assert t.find_talkgroup(1001.25)[1] == 200
+
+    import msgq_record
+    q = [0x3a000012ae01013348704a54, 0x02900031210020018e7cdb8f]
+    msgs = [msgq_record.recorded_msg(-2, 'skip'), msgq_record.recorded_msg(-1, ''), msgq_record.recorded_msg(15, QMSG_NAC.pack(0x293))]
+    msgs += [msgq_record.recorded_msg(7, QMSG_TSBK.pack(0x293 + i, q[i & 1] >> 32, q[i & 1] & 0xffffffff)) for i in xrange(QMSG_BATCH_MIN)]
+    nacs, tsbks, crcs = qmsg_decode(msgs)	# whole batch through qmsg_array
+    single = [qmsg_decode([msg]) for msg in msgs]	# one at a time, through struct
+    assert nacs == [n[0] for n, t, c in single] and tsbks == [t[0] for n, t, c in single]
+    assert crcs[3:] == [crc16_tsbk(tsbk) for tsbk in tsbks[3:]] and single[3][2] is None
+    assert nacs[:3] == [0, 0, 0x293] and nacs[-1] == 0x293 + QMSG_BATCH_MIN - 1 and tsbks[-1] == q[1]
 
 if __name__ == '__main__':
     main()
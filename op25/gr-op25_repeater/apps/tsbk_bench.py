@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Max H. Parke KA1RBI
+#
+# This file is part of OP25
+#
+# OP25 is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# OP25 is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OP25; see the file COPYING. If not, write to the Free
+# Software Foundation, Inc., 51 Franklin Street, Boston, MA
+# 02110-1301, USA.
+
+#
+# TSBK decode micro-benchmark
+#
+# Feeds a TSBK corpus through trunking.trunked_system.decode_tsbk and
+# reports messages/sec.  The corpus is a text file with one TSBK per
+# line, given as the last hex token on the line (so the "TSBK: 0x.. 0x.."
+# lines printed at -v 11 can be used directly).  Without -i a synthetic
+# control channel mix is generated.
+#
+# -t sets the number of talkgroups in the synthetic corpus; a day of
+# traffic on a large system touches thousands.  -m reports the size of
+# the talkgroup and voice frequency tables after the run.
+#
+# With -s each TSBK is followed by the talkgroup queries the rx_ctl
+# scheduler makes per message (get_updated_talkgroups, find_talkgroup).
+#
+# Use -r to time a second copy of trunking.py (for example one checked
+# out from an earlier revision) against the same corpus.
+#
+
+import sys
+import time
+import imp
+from optparse import OptionParser
+
+import trunking
+
+def mk_tsbk(fields):	# build a 96-bit tsbk from (shift, value) pairs, with crc
+    tsbk = 0
+    for shift, value in fields:
+        tsbk |= value << shift
+    return tsbk + trunking.crc16(tsbk, 12)
+
+def synth_corpus(n, tgids=700):
+    iden = [mk_tsbk([(88, 0x3d), (76, 1), (67, 0x64), (48, 100), (16, 851006250 / 5)]),	# iden_up
+            mk_tsbk([(88, 0x33), (76, 2), (72, 3), (48, 100), (16, 769006250 / 5)])]	# iden_up_tdma
+    status = [mk_tsbk([(88, 0x3a), (56, 0x290), (48, 1), (40, 1), (24, 0x1001)]),	# rfss status
+              mk_tsbk([(88, 0x3b), (52, 0xbee00), (40, 0x290), (24, 0x1001)]),	# network status
+              mk_tsbk([(88, 0x39), (72, 1), (64, 1), (48, 0x1003), (24, 0x1005)]),	# secondary cc
+              mk_tsbk([(88, 0x3c), (48, 2), (40, 7), (24, 0x1011)])]	# adjacent status
+    corpus = iden[:]
+    i = 0
+    while len(corpus) < n:
+        call = i / 4	# grant updates are repeated while the call lasts
+        tg1 = 100 + (call % (tgids * 4 / 7))
+        tg2 = 100 + (tgids * 4 / 7) + (call % (tgids - tgids * 4 / 7))
+        ch1 = 0x1000 + (call % 20)
+        ch2 = 0x2000 + ((call + 7) % 20)
+        if i % 8 == 0:
+            corpus.append(mk_tsbk([(88, 0x00), (56, ch1), (40, tg1), (16, 0x123456)]))	# grant
+        elif i % 8 < 6:
+            corpus.append(mk_tsbk([(88, 0x02), (64, ch1), (48, tg1), (32, ch2), (16, tg2)]))	# grant update
+        else:
+            corpus.append(status[i % len(status)])
+        if i % 50 == 49:
+            corpus.append(iden[i % len(iden)])
+        i += 1
+    return corpus[:n]
+
+def read_corpus(filename):
+    corpus = []
+    for line in open(filename):
+        tokens = line.split()
+        if not tokens:
+            continue
+        corpus.append(int(tokens[-1], 16))
+    return corpus
+
+def table_bytes(table):	# container, records and the lists they hold
+    total = sys.getsizeof(table)
+    for rec in table.itervalues():
+        total += sys.getsizeof(rec)
+        if isinstance(rec, dict):
+            fields = rec.values()
+        else:
+            fields = [getattr(rec, k) for k in rec.__slots__]
+        for v in fields:
+            if isinstance(v, list):
+                total += sys.getsizeof(v)
+    return total
+
+def report(name, tsys, memory):
+    print '%s: %s' % (name, ' '.join(['%s %d' % (k, tsys.stats[k]) for k in sorted(tsys.stats)]))
+    if memory:
+        for k in ['talkgroups', 'voice_frequencies']:
+            table = getattr(tsys, k)
+            print '%s: %s %d entries %d bytes' % (name, k, len(table), table_bytes(table))
+
+def run(module, corpus, passes, scheduler=False):
+    tsys = module.trunked_system()
+    t0 = time.time()
+    for p in xrange(passes):
+        for tsbk in corpus:
+            curr_time = time.time()
+            tsys.decode_tsbk(tsbk)
+            if scheduler:
+                tsys.get_updated_talkgroups(curr_time)
+                tsys.find_talkgroup(curr_time)
+    elapsed = time.time() - t0
+    return tsys, len(corpus) * passes / elapsed
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-i", "--input", type="string", default=None, help="TSBK corpus file (hex, one per line)")
+    parser.add_option("-n", "--count", type="int", default=10000, help="size of synthetic corpus")
+    parser.add_option("-p", "--passes", type="int", default=20, help="number of passes over the corpus")
+    parser.add_option("-t", "--tgids", type="int", default=700, help="talkgroups in synthetic corpus")
+    parser.add_option("-m", "--memory", action="store_true", default=False, help="report table sizes")
+    parser.add_option("-s", "--scheduler", action="store_true", default=False, help="include per-message scheduler queries")
+    parser.add_option("-r", "--reference", type="string", default=None, help="trunking.py to compare against")
+    (options, args) = parser.parse_args()
+
+    if options.input:
+        corpus = read_corpus(options.input)
+    else:
+        corpus = synth_corpus(options.count, options.tgids)
+
+    tsys, rate = run(trunking, corpus, options.passes, options.scheduler)
+    print 'trunking: %d tsbks x %d passes: %.0f tsbks/sec' % (len(corpus), options.passes, rate)
+    report('trunking', tsys, options.memory)
+    if options.reference:
+        ref = imp.load_source('trunking_ref', options.reference)
+        ref_tsys, ref_rate = run(ref, corpus, options.passes, options.scheduler)
+        print 'reference: %d tsbks x %d passes: %.0f tsbks/sec' % (len(corpus), options.passes, ref_rate)
+        report('reference', ref_tsys, options.memory)
+        print 'speedup %.2fx' % (rate / ref_rate)
+
+if __name__ == '__main__':
+    main()
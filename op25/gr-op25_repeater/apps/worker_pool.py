@@ -0,0 +1,104 @@
+
+# Copyright 2016 Max H. Parke KA1RBI
+#
+# This file is part of OP25
+#
+# OP25 is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# OP25 is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public
+# License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with OP25; see the file COPYING. If not, write to the Free
+# Software Foundation, Inc., 51 Franklin Street, Boston, MA
+# 02110-1301, USA.
+
+#
+# logfile worker pool
+#
+# Builds the logfile workers (a p25_demod_cb / p25_decoder_sink_b
+# pair each, fed from the source or the shared channelizer) for
+# scope.py and rx.py.  The -L initial workers are built by
+# build_workers once rx_ctl has read the trunking config and knows the
+# demodulator type of the system.  With --max-workers above -L the pool
+# grows on demand: rx_ctl calls add_workers when a grant finds no free
+# worker, once per scheduler pass, and all the workers it asks for are
+# built under a single lock/unlock of the flowgraph.  The pool only
+# grows and --max-workers, a worker count, is its only cap.  Workers
+# are never torn down; a worker is parked (p25_demod_cb.set_idle) as
+# soon as rx_ctl releases it and then costs next to nothing, where
+# tearing it down would mean another lock/unlock stall of every
+# running call.
+#
+
+from gnuradio import gr, blocks
+
+import p25_demodulator
+import p25_decoder
+
+class worker_pool(object):
+    def __init__(self, tb, source, capture_rate, options):
+        self.tb = tb
+        self.source = source
+        self.capture_rate = capture_rate
+        self.options = options
+        self.workers = []	# shared with rx_ctl as logfile_workers
+        self.max_workers = max(options.max_workers or 0, options.logfile_workers)
+        self.num_ambe = 0
+        if options.phase2_tdma:
+            self.num_ambe = 2
+        self.channelizer = None
+        self.null_sinks = {}	# unused channelizer outputs
+
+        use_channelizer = options.channelizer
+        numchans = p25_demodulator.channelizer_channels(capture_rate)
+        if use_channelizer and self.max_workers > numchans:
+            print 'worker pool: %d workers exceed the %d channelizer channels at %d sps; running each worker on the full input' % (self.max_workers, numchans, capture_rate)
+            use_channelizer = False
+        if use_channelizer:
+            self.channelizer = p25_demodulator.p25_channelizer(input_rate=capture_rate, outputs=self.max_workers)
+            tb.connect(source, self.channelizer)
+            for i in xrange(self.max_workers):
+                self.null_sinks[i] = blocks.null_sink(gr.sizeof_gr_complex)
+                tb.connect((self.channelizer, i), self.null_sinks[i])
+
+    def build_workers(self, n, demod_type):
+        # assumes lock held or init
+        for i in xrange(n):
+            self.build_worker(demod_type)
+
+    def build_worker(self, demod_type):
+        # assumes lock held or init
+        i = len(self.workers)
+        demod = p25_demodulator.p25_demod_cb(input_rate=self.capture_rate,
+                                             demod_type=demod_type,
+                                             offset=self.options.offset,
+                                             channelizer=self.channelizer,
+                                             channel=i,
+                                             xlate=self.options.xlate,
+                                             parkable=True)
+        demod.set_idle(True)
+        decoder = p25_decoder.p25_decoder_sink_b(debug = self.options.verbosity, do_imbe = self.options.vocoder, num_ambe=self.num_ambe)
+        if self.channelizer is not None:
+            if i in self.null_sinks:
+                self.tb.disconnect((self.channelizer, i), self.null_sinks.pop(i))
+            self.tb.connect((self.channelizer, i), demod, decoder)
+        else:
+            self.tb.connect(self.source, demod, decoder)
+        self.workers.append({'demod': demod, 'decoder': decoder, 'active': False})
+
+    def add_workers(self, n, demod_type):
+        # rx_ctl callback, returns the number of workers added
+        n = min(n, self.max_workers - len(self.workers))
+        if n <= 0:
+            return 0
+        self.tb.lock()
+        self.build_workers(n, demod_type)
+        self.tb.unlock()
+        print 'worker pool: added %d, %d of %d workers' % (n, len(self.workers), self.max_workers)
+        return n
@@ -48,6 +48,7 @@ namespace gr {
        */
       static sptr make(float samples_per_symbol, float gain_mu, float gain_omega, float alpha, float beta, float max_freq, float min_freq);
       virtual void set_omega(float omega) {}
+      virtual void reset() {}
     };
 
   } // namespace op25_repeater
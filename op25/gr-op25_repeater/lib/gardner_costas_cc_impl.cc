@@ -168,6 +168,18 @@ void gardner_costas_cc_impl::set_omega (float omega) {
     memset(d_dl, 0, NUM_COMPLEX * sizeof(gr_complex));
 }
 
+void gardner_costas_cc_impl::reset () {
+    d_mu = 0;
+    d_omega = d_omega_mid;
+    d_last_sample = 0;
+    d_dl_index = 0;
+    d_interp_counter = 0;
+    d_phase = 0;
+    d_freq = 0;
+    nid_accum = 0;
+    memset(d_dl, 0, NUM_COMPLEX * sizeof(gr_complex));
+}
+
 
 void
 gardner_costas_cc_impl::forecast(int noutput_items, gr_vector_int &ninput_items_required)
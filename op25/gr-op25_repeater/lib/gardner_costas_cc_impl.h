@@ -68,6 +68,9 @@ namespace gr {
   //! Sets value of omega and its min and max values 
   void set_omega (float omega);
 
+  //! Clears the timing and carrier loop state
+  void reset ();
+
 protected:
   bool input_sample0(gr_complex, gr_complex& outp);
   bool input_sample(gr_complex, gr_complex& outp);
@@ -42,9 +42,14 @@ namespace gr {
 	static const char wbuf[2] = {0xff, 0xff}; // dummy NAC
 	if (!d_do_msgq)
 		return;
-	if (d_msg_queue->full_p())
+	if (d_msg_queue->full_p()) {
+		d_msgq_drops++;
 		return;
-	gr::message::sptr msg = gr::message::make_from_string(std::string(wbuf, 2), duid, 0, 0);
+	}
+	struct timeval tv;
+	gettimeofday(&tv, 0);
+	double t = tv.tv_sec + tv.tv_usec * 1e-6;	// queue time, as in p25p1_fdma
+	gr::message::sptr msg = gr::message::make_from_string(std::string(wbuf, 2), duid, t, 0);
 	d_msg_queue->insert_tail(msg);
     }
 
@@ -56,6 +61,10 @@ namespace gr {
 	p2tdma.set_slotid(slotid);
     }
 
+    long p25_frame_assembler_impl::get_msgq_drops() {
+	return d_msgq_drops + p1fdma.get_msgq_drops();
+    }
+
     p25_frame_assembler::sptr
     p25_frame_assembler::make(const char* udp_host, int port, int debug, bool do_imbe, bool do_output, bool do_msgq, gr::msg_queue::sptr queue, bool do_audio_output, bool do_phase2_tdma)
     {
@@ -92,7 +101,8 @@ static const int MAX_IN = 1;	// maximum number of input streams
 	d_do_phase2_tdma(do_phase2_tdma),
 	p2tdma(0, debug, output_queue),
 	d_do_msgq(do_msgq),
-	d_msg_queue(queue)
+	d_msg_queue(queue),
+	d_msgq_drops(0)
 {
 	if (d_do_audio_output && !d_do_output)
 		fprintf(stderr, "p25_frame_assembler: error: do_output must be enabled if do_audio_output is enabled\n");
@@ -49,12 +49,14 @@ namespace gr {
 	p25p2_tdma p2tdma;
 	bool d_do_msgq;
 	gr::msg_queue::sptr d_msg_queue;
+	long d_msgq_drops;
 
   // internal functions
 
     void p25p2_queue_msg(int duid);
     void set_xormask(const char*p) ;
     void set_slotid(int slotid) ;
+    long get_msgq_drops() ;
 	typedef std::vector<bool> bit_vector;
 	std::deque<int16_t> output_queue;
 
@@ -207,6 +207,7 @@ p25p1_fdma::p25p1_fdma(const char* udp_host, int port, int debug, bool do_imbe,
 	d_do_output(do_output),
 	d_do_msgq(do_msgq),
 	d_msg_queue(queue),
+	d_msgq_drops(0),
 	output_queue(output_queue),
 	framer(new p25_framer()),
 	d_do_audio_output(do_audio_output),
@@ -224,8 +225,10 @@ p25p1_fdma::process_duid(uint32_t const duid, uint32_t const nac, uint8_t const
 	int p = 0;
 	if (!d_do_msgq)
 		return;
-	if (d_msg_queue->full_p())
+	if (d_msg_queue->full_p()) {
+		d_msgq_drops++;
 		return;
+	}
 	assert (len+2 <= sizeof(wbuf));
 	wbuf[p++] = (nac >> 8) & 0xff;
 	wbuf[p++] = nac & 0xff;
@@ -233,9 +236,11 @@ p25p1_fdma::process_duid(uint32_t const duid, uint32_t const nac, uint8_t const
 		memcpy(&wbuf[p], buf, len);	// copy data
 		p += len;
 	}
-	gr::message::sptr msg = gr::message::make_from_string(std::string(wbuf, p), duid, 0, 0);
-	d_msg_queue->insert_tail(msg);
 	gettimeofday(&last_qtime, 0);
+	// arg1 carries the time the message was queued, for latency tracking
+	double t = last_qtime.tv_sec + last_qtime.tv_usec * 1e-6;
+	gr::message::sptr msg = gr::message::make_from_string(std::string(wbuf, p), duid, t, 0);
+	d_msg_queue->insert_tail(msg);
 //	msg.reset();
 }
 
@@ -57,6 +57,7 @@ namespace gr {
 	bool d_do_output;
 	bool d_do_msgq;
 	gr::msg_queue::sptr d_msg_queue;
+	long d_msgq_drops;
 	std::deque<int16_t> &output_queue;
 	p25_framer* framer;
 	struct timeval last_qtime;
@@ -65,6 +66,7 @@ namespace gr {
 
      public:
 	void rx_sym (const uint8_t *syms, int nsyms);
+	long get_msgq_drops() { return d_msgq_drops; }
       p25p1_fdma(const char* udp_host, int port, int debug, bool do_imbe, bool do_output, bool do_msgq, gr::msg_queue::sptr queue, std::deque<int16_t> &output_queue, bool do_audio_output);
       ~p25p1_fdma();
 